@@ -3,6 +3,7 @@ import random
 import pickle
 import rdflib
 from rdflib.plugin import PluginException
+from templates import build_template_index
 
 def parse_rdf(file_path):
     """
@@ -50,11 +51,13 @@ def knowledge_base():
     Environment Variables:
         KB_TURTLE_FILE_PATH (str): Path to the RDF Turtle input file.
         KB_PICKLE_FILE_PATH (str): Path to save the output pickle file containing the splits.
+        TEMPLATE_INDEX_PATH (str, optional): Path to save the precomputed answers of the question templates.
 
     Behavior:
         - Parses the RDF file to extract triples.
         - Splits the triples into train/validation/test.
         - Saves the resulting datasets as a pickle file.
+        - Materializes the template index of the saved knowledge base, if requested.
     """
     input_path = os.getenv('KB_TURTLE_FILE_PATH')
     output_path = os.getenv('KB_PICKLE_FILE_PATH')
@@ -81,5 +84,10 @@ def knowledge_base():
     with open(output_path, 'wb') as f:
         pickle.dump((train_triples, valid_triples, test_triples), f)
 
+    # The index is rebuilt with every knowledge base so the apps never serve stale answers
+    template_index_path = os.getenv('TEMPLATE_INDEX_PATH')
+    if template_index_path:
+        build_template_index(output_path, template_index_path)
+
 if __name__ == "__main__":
     knowledge_base()
\ No newline at end of file
@@ -0,0 +1,276 @@
+import os
+import re
+import json
+import pickle
+import hashlib
+
+PREFIXES = {
+    "http://d3fend.mitre.org/ontologies/d3fend.owl#": "ns0",
+    "http://example.org/network#": "ns1",
+    "http://example.org/stix#": "ns2",
+}
+# Namespaces the apps strip from the names of the context triples
+SHORTENED_NAMESPACES = (
+    "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "http://www.w3.org/2000/01/rdf-schema#",
+    "http://example.org/stix#",
+    "http://d3fend.mitre.org/ontologies/d3fend.owl#",
+    "http://example.org/network#",
+    "http://www.w3.org/2002/07/owl#",
+    "http://www.w3.org/2004/02/skos/core#",
+)
+LABEL_PREDICATES = (
+    "http://www.w3.org/2000/01/rdf-schema#label",
+    "http://www.w3.org/2004/02/skos/core#altLabel",
+)
+
+# Frequent question templates, each answered by the entities on the other side of a single relation
+# around one entity. "position" is the side of the relation the entity of the question is on. Patterns are matched
+# against the lowercased question, without its final punctuation.
+TEMPLATES = {
+    "mitigates": {
+        "predicate": "http://example.org/stix#mitigates",
+        "position": "object",
+        "patterns": [
+            r"^how (?:can|do|should|could) (?:i|we|you) (?:mitigate|defend against|protect against) (?P<entity>.+)$",
+            r"^how to (?:mitigate|defend against|protect against) (?P<entity>.+)$",
+            r"^(?:what|which)(?: \w+){0,3} (?:mitigates?|can mitigate) (?P<entity>.+)$",
+            r"^(?:what are )?(?:the )?mitigations? (?:for|of|against) (?P<entity>.+)$",
+        ],
+    },
+    "detects": {
+        "predicate": "http://example.org/stix#detects",
+        "position": "object",
+        "patterns": [
+            r"^how (?:can|do|should|could) (?:i|we|you) detect (?P<entity>.+)$",
+            r"^how to detect (?P<entity>.+)$",
+            r"^(?:what|which)(?: \w+){0,3} (?:detects?|can detect) (?P<entity>.+)$",
+        ],
+    },
+    "uses": {
+        "predicate": "http://example.org/stix#uses",
+        "position": "object",
+        "patterns": [
+            r"^(?:what|which|who)(?: \w+){0,3} (?:uses?|can use|exploits?) (?P<entity>.+)$",
+        ],
+    },
+    "contains": {
+        "predicate": "http://example.org/network#contains",
+        "position": "subject",
+        "patterns": [
+            r"^what does (?P<entity>.+) contain$",
+            r"^what is (?:in|inside) (?P<entity>.+)$",
+            r"^(?:what|which)(?: \w+){0,2} are (?:in|inside|part of) (?P<entity>.+)$",
+            r"^(?:list|show)(?: me)? (?:the )?(?:contents|devices|hosts|assets) of (?P<entity>.+)$",
+        ],
+    },
+}
+
+# Words around the entity name that the patterns leave in the captured group
+ENTITY_AFFIXES = r"^(?:an?|the) |(?: (?:attacks?|techniques?|network|group|malware))$"
+
+
+def extract_name(url):
+    """
+    Extracts the last part of a URI to get a readable entity name.
+
+    Args:
+        url (str): A full URI string.
+
+    Returns:
+        str: The extracted entity name.
+    """
+    return re.split(r'[#/]', url)[-1]
+
+
+def shorten(name):
+    """
+    Shortens a name the way the apps do before building their context, leaving literals untouched.
+
+    Args:
+        name (str): A URI or a literal.
+
+    Returns:
+        str: The local name of the URI if it is in a known namespace, otherwise the name itself.
+    """
+    if name.startswith(SHORTENED_NAMESPACES):
+        return re.split(r'[#/]', name)[-1]
+    return name
+
+
+def compact(text):
+    """
+    Normalizes an entity name or alias so that spacing, case and punctuation do not matter.
+
+    Args:
+        text (str): An entity name, label or the part of a question naming an entity.
+
+    Returns:
+        str: The lowercased alphanumeric characters of the text.
+    """
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+
+def to_neo4j(uri):
+    """
+    Converts a URI into the prefixed name used by the Neo4j graph.
+
+    Args:
+        uri (str): A full URI string.
+
+    Returns:
+        str: The name with its n10s namespace prefix, e.g. ns2__mitigates.
+    """
+    for namespace, prefix in PREFIXES.items():
+        if uri.startswith(namespace):
+            return f"{prefix}__{uri[len(namespace):]}"
+    return uri
+
+
+def file_version(file_path):
+    """
+    Computes the short content hash the apps use to identify a knowledge base version.
+
+    Args:
+        file_path (str): Path to the knowledge base pickle file.
+
+    Returns:
+        str: The first 16 hex digits of the SHA-256 of the file.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def build_aliases(triples):
+    """
+    Maps the compacted names, labels and alternative labels of the entities to their URIs.
+
+    Args:
+        triples (list): The (subject, predicate, object) triples of the knowledge base.
+
+    Returns:
+        dict: A mapping from each compacted alias to the list of URIs it may refer to.
+    """
+    aliases = {}
+    for s, p, o in triples:
+        names = [(s, extract_name(s))]
+        if p in LABEL_PREDICATES:
+            names.extend((s, label) for label in o.splitlines())
+        for uri, name in names:
+            key = compact(name)
+            if key and uri not in aliases.setdefault(key, []):
+                aliases[key].append(uri)
+    return aliases
+
+
+def build_answers(triples):
+    """
+    Precomputes, for every template and every entity it applies to, the entities answering it and the
+    equivalent Cypher query.
+
+    Args:
+        triples (list): The (subject, predicate, object) triples of the knowledge base.
+
+    Returns:
+        dict: A mapping from template name to a mapping from entity URI to its precomputed answer.
+    """
+    answers = {name: {} for name in TEMPLATES}
+    for s, p, o in triples:
+        for name, template in TEMPLATES.items():
+            if p != template["predicate"]:
+                continue
+            entity, counterpart = (s, o) if template["position"] == "subject" else (o, s)
+            answers[name].setdefault(entity, {"entities": []})["entities"].append(counterpart)
+
+    for name, template in TEMPLATES.items():
+        side, other = ("s", "o") if template["position"] == "subject" else ("o", "s")
+        for entity, answer in answers[name].items():
+            answer["entities"] = sorted(set(answer["entities"]))
+            answer["cypher"] = (
+                f"MATCH (s)-[:{to_neo4j(template['predicate'])}]->(o) WHERE {side}.uri = \"{entity}\" "
+                f"RETURN DISTINCT {other}.uri AS uri"
+            )
+    return answers
+
+
+def build_entity_triples(triples, answers):
+    """
+    Collects the context the full pipeline builds for the entities of the precomputed answers: the
+    triples where each of them is the subject or the object, in knowledge base order.
+
+    Args:
+        triples (list): The (subject, predicate, object) triples of the knowledge base.
+        answers (dict): The precomputed answers returned by build_answers.
+
+    Returns:
+        dict: A mapping from each shortened entity name to its triples, stored once however many
+        answers it appears in.
+    """
+    names = {shorten(uri) for entities in answers.values() for answer in entities.values() for uri in answer["entities"]}
+    entity_triples = {name: [] for name in names}
+    for triple in triples:
+        s, p, o = (shorten(name) for name in triple)
+        for name in dict.fromkeys((s, o)):
+            if name in entity_triples:
+                entity_triples[name].append([s, p, o])
+    return entity_triples
+
+
+def build_template_index(kb_path, output_path):
+    """
+    Materializes the answers of the frequent question templates over the knowledge base.
+
+    Args:
+        kb_path (str): Path to the knowledge base pickle file.
+        output_path (str): Path of the JSON index to write.
+    """
+    with open(kb_path, "rb") as f:
+        train_triples, valid_triples, test_triples = pickle.load(f)
+    triples = train_triples + valid_triples + test_triples
+
+    answers = build_answers(triples)
+    index = {
+        "kb_version": file_version(kb_path),
+        "entity_affixes": ENTITY_AFFIXES,
+        "templates": {name: template["patterns"] for name, template in TEMPLATES.items()},
+        "aliases": build_aliases(triples),
+        "answers": answers,
+        "entity_triples": build_entity_triples(triples, answers),
+    }
+
+    # Write to a temporary file first so the apps never read a truncated index
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, output_path)
+
+    for name, entities in answers.items():
+        print(f"Template '{name}': {len(entities)} entities")
+
+
+def main():
+    """
+    Builds the template index of the knowledge base.
+
+    Environment Variables:
+        KB_PICKLE_FILE_PATH (str): Path to the knowledge base pickle file.
+        TEMPLATE_INDEX_PATH (str): Path to save the template index.
+    """
+    kb_path = os.getenv("KB_PICKLE_FILE_PATH")
+    output_path = os.getenv("TEMPLATE_INDEX_PATH")
+
+    if not kb_path or not os.path.exists(kb_path):
+        print("Error: Knowledge base pickle path is not defined or does not exist.")
+        return
+    if not output_path:
+        print("Error: Template index path is not defined.")
+        return
+
+    build_template_index(kb_path, output_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
 import os
 import re
-from fastapi import FastAPI
+import json
+import hashlib
+from fastapi import Response
 from pydantic import BaseModel
-from langchain_openai import ChatOpenAI
+from prompt import build_messages, build_system_prompt, example_bank_path, load_example_index, load_triples
+from common.answer_cache import normalize_question
+from common.cache_backend import cache_from_env
+from common.llm_gateway import gateway_from_env
+from common.service import create_app
 
-# Initialize FastAPI app
-app = FastAPI()
+# Translation cache shared by all the workers through the configured backend
+cache = cache_from_env()
+
+# Initialize FastAPI app with health endpoints
+app = create_app(checks=[cache.ping], on_shutdown=[cache.close])
 
 # Pydantic model for request body
 class QueryRequest(BaseModel):
@@ -38,15 +47,22 @@ def extract_name(url: str) -> str:
     # Return the last segment after removing matching prefixes
     return next((re.split(r'[#/]', url)[-1] for prefix in prefixes if url.startswith(prefix)), url)
 
-# Initialize the OpenAI LLM for Cypher translation
-llm = ChatOpenAI(
-    temperature=0,  # Low temperature for deterministic results
-    api_key=os.getenv("OPENAI_API_TOKEN"),
-    model="gpt-4o-mini" # Lightweight GPT-4 variant
-)
+# LLM for Cypher translation, behind the gateway that rate-limits, retries and coalesces the calls
+llm = gateway_from_env()
+
+# Built once at startup: the system prompt is a byte-identical, cacheable prefix
+SYSTEM_PROMPT = build_system_prompt(load_triples(os.getenv("KB_PICKLE_FILE_PATH")))
+EXAMPLE_INDEX = load_example_index(example_bank_path())
+FEW_SHOT_EXAMPLES = int(os.getenv("FEW_SHOT_EXAMPLES", 2))
+
+# Cached translations are invalidated whenever the prompt changes
+PROMPT_VERSION = hashlib.sha256(
+    json.dumps([SYSTEM_PROMPT, EXAMPLE_INDEX["examples"], FEW_SHOT_EXAMPLES]).encode()
+).hexdigest()[:16]
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", 86400))
 
 @app.post("/translate")
-async def translate_query(request: QueryRequest):
+async def translate_query(request: QueryRequest, response: Response):
     """
     Endpoint that receives a natural language question and returns a Cypher query.
 
@@ -55,85 +71,22 @@ async def translate_query(request: QueryRequest):
 
     Returns:
         dict: A dictionary with the translated Cypher query.
+        The X-Translation-Cache header tells whether it was served from the translation cache.
     """
     question = request.question
 
-    # Prompt template with system instructions and schema/examples
-    prompt = [
-        {"role": "system", "content": """
-        You are an AI that translates natural language queries into Cypher queries.  
-        Your task is to output only the Cypher query with no additional text.  
-        The Cypher query must return triples in subject-predicate-object format or the URIs of the entities involved. When representing subject, predicate and object, represent them with s, p, o, respectively.
-
-        ### Graph Schema
-        The knowledge graph consists of the following main entity types and relationships:
-
-        **Entities:**
-        - `ns0__Network`: Represents a computer network.
-        - `Server`: A computing entity providing services, including:
-        - `MailServer` (subtypes: `ns1__SMTPServer`, `ns1__IMAPServer`, `ns1__POP3Server`)
-        - `ns0__DNSServer`
-        - `ns0__VPNServer`
-        - `ComputerNetworkNode`: Includes `ns0__Router`, `ns0__WirelessAccessPoint`, `ns0__Firewall`
-        - `PersonalComputer`: Includes `ns0__LaptopComputer`, `ns0__DesktopComputer`, `ns0__MobilePhone`
-        - `ns2__AttackPattern`: Represents different types of cyber attacks.
-        - `ns2__CourseOfAction`: Represents mitigation strategies.
-        - `ns2__DataComponent`: Represents detection mechanisms.
-        - `ns2__Malware`: Represents different types of malicious software.
-        - `ns2__IntrusionSet`: Represents adversarial groups.
-
-        **Relationships:**
-        - `ns1__contains`: `(ns0__Network) -[:ns1__contains]-> (Server | ComputerNetworkNode | PersonalComputer)`
-        - `ns1__wired_connection`: `(ns1__SMTPServer | ns1__POP3Server | ns0__DNSServer | ns0__VPNServer) -[:ns1__wired_connection]-> (ns0__Router)`
-        - `ns1__wireless_connection`: `(ns0__LaptopComputer | ns0__DesktopComputer | ns0__MobilePhone) -[:ns1__wireless_connection]-> (ns0__WirelessAccessPoint)`
-        - `ns1__provides_vpn_access`: `(ns0__VPNServer) -[:ns1__provides_vpn_access]-> (DigitalArtifact)`
-        - `ns1__delivers_mail`: `(SMTPServer) -[:ns1__delivers_mail]-> (MailServerReceiver)`
-        - `ns1__resolves_mail`: `(DNSServer) -[:ns1__resolves_mail]-> (MailServer)`
-        - `ns1__validates_mail_domains`: `(DNSServer) -[:ns1__validates_mail_domains]-> (MailServer)`
-        - `ns1__filter_traffic`: `(Firewall) -[:ns1__filter_traffic]-> (Server | Router)`
-        - `ns2__mitigates`: `(ns2__CourseOfAction) -[:ns2__mitigates]-> (ns2__AttackPattern)`
-        - `ns2__detects`: `(ns2__DataComponent) -[:ns2__detects]-> (ns2__AttackPattern)`
-        - `ns2__uses`: `(ns2__Malware | ns2__IntrusionSet) -[:ns2__uses]-> (ns2__AttackPattern)`
-
-        ### Examples:
-
-        #### Example 1
-        **Natural language:** "Are there DNS, NTP, or other UDP-based services in LAN1?"  
-        **Cypher Query:**
-        MATCH (s:ns0__Network {rdfs__label: "LAN 1"})-[p:ns1__contains]->(o)
-        WHERE tolower(o.uri) CONTAINS "dns" OR tolower(o.uri) CONTAINS "ntp"
-        RETURN s.uri AS subject, type(p) AS predicate, o.uri AS object
-
-        #### Example 2
-        **Natural language:** "Can you explain how a Reflection Amplification attack works?"
-        **Cypher Query:**
-        MATCH (ap:ns2__AttackPattern)
-        WHERE tolower(ap.uri) CONTAINS "reflectionamplification" 
-        RETURN ap.uri AS uri
-
-        #### Example 3
-        **Natural language:** "I detected many incoming UDP packets to my network that have 'ANY' as an argument. What might this be due to?"
-        **Cypher Query:**
-        MATCH (dc:ns2__DataComponent)
-        RETURN dc.uri AS uri
-        UNION
-        MATCH (ap:ns2__AttackPattern)
-        RETURN ap.uri AS uri
-        
-        #### Example 4
-        **Natural language:** "How can I mitigate a Reflection Amplification attack?"
-        **Cypher Query:**
-        MATCH (s)-[p:`ns2__mitigates`]->(o:ns2__AttackPattern)
-        WHERE tolower(o.uri) CONTAINS "reflectionamplification"
-        RETURN s.uri AS uri
-
-        Ensure that the output strictly follows the Cypher query format and does not include any explanatory text.
-        """},
-        {"role": "user", "content": f"Question:\n{question}"}
-    ]
+    key = f"translation:{PROMPT_VERSION}:{hashlib.sha256(normalize_question(question).encode()).hexdigest()}"
+    cached = cache.get(key)
+    response.headers["X-Translation-Cache"] = "HIT" if cached is not None else "MISS"
+    if cached is not None:
+        return {"cypher_query": cached.decode()}
+
+    # Static schema prefix followed by the most relevant examples and the question
+    prompt = build_messages(question, SYSTEM_PROMPT, EXAMPLE_INDEX, FEW_SHOT_EXAMPLES)
 
-    # Invoke the language model with the crafted prompt
-    response = llm.invoke(prompt)
-    cypher_query = response.content.strip()
+    # Invoke the language model without blocking the worker's event loop
+    llm_response = await llm.ainvoke(prompt)
+    cypher_query = llm_response.content.strip()
+    cache.set(key, cypher_query, ex=TRANSLATION_CACHE_TTL)
 
     return {"cypher_query": cypher_query}
@@ -0,0 +1,262 @@
+import os
+import re
+import json
+import math
+import pickle
+from collections import Counter, defaultdict
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+RDFS_SUBCLASS_OF = "http://www.w3.org/2000/01/rdf-schema#subClassOf"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+
+# Prefixes assigned by neosemantics (n10s) when the Turtle file is imported into Neo4j
+NEO4J_PREFIXES = {
+    "http://d3fend.mitre.org/ontologies/d3fend.owl#": "ns0",
+    "http://example.org/network#": "ns1",
+    "http://example.org/stix#": "ns2",
+    "http://www.w3.org/1999/02/22-rdf-syntax-ns#": "rdf",
+    "http://www.w3.org/2000/01/rdf-schema#": "rdfs",
+    "http://www.w3.org/2002/07/owl#": "owl",
+    "http://www.w3.org/2004/02/skos/core#": "skos",
+}
+
+# Namespaces describing the ontology itself rather than the knowledge graph content
+VOCABULARY_NAMESPACES = (
+    "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "http://www.w3.org/2000/01/rdf-schema#",
+    "http://www.w3.org/2002/07/owl#",
+)
+
+INSTRUCTIONS = """You are an AI that translates natural language queries into Cypher queries.
+Your task is to output only the Cypher query with no additional text.
+The Cypher query must return triples in subject-predicate-object format or the URIs of the entities involved. When representing subject, predicate and object, represent them with s, p, o, respectively.
+Ensure that the output strictly follows the Cypher query format and does not include any explanatory text."""
+
+
+def to_neo4j(uri: str) -> str:
+    """
+    Converts a full URI into the shortened name used by n10s for labels, relationship types and properties.
+
+    Args:
+        uri (str): A full URI string.
+
+    Returns:
+        str: The `prefix__name` form of the URI, or the URI itself if its namespace is unknown.
+    """
+    for namespace, prefix in NEO4J_PREFIXES.items():
+        if uri.startswith(namespace):
+            return f"{prefix}__{uri[len(namespace):]}"
+    return uri
+
+
+def load_triples(file_path: str) -> list:
+    """
+    Loads all the triples of the knowledge base pickle produced by the knowledge_base component.
+
+    Args:
+        file_path (str): Path to the knowledge base pickle file.
+
+    Returns:
+        list: The train, validation and test triples concatenated.
+    """
+    with open(file_path, "rb") as f:
+        train_triples, valid_triples, test_triples = pickle.load(f)
+    return train_triples + valid_triples + test_triples
+
+
+def build_schema(triples: list) -> str:
+    """
+    Builds a compact description of the graph schema from the labels and predicates actually present in the KB.
+
+    Args:
+        triples (list): The (subject, predicate, object) triples of the knowledge base.
+
+    Returns:
+        str: The schema section of the system prompt.
+    """
+    types = defaultdict(set)
+    parents = {}
+    labels = {}
+    for s, p, o in triples:
+        if p == RDF_TYPE and not o.startswith(VOCABULARY_NAMESPACES):
+            types[s].add(o)
+        elif p == RDFS_SUBCLASS_OF:
+            parents[s] = o
+        elif p == RDFS_LABEL:
+            labels[s] = o
+
+    instances = defaultdict(list)
+    for entity, entity_types in types.items():
+        for entity_type in entity_types:
+            instances[entity_type].append(entity)
+
+    relations = defaultdict(lambda: (set(), set()))
+    properties = defaultdict(set)
+    for s, p, o in triples:
+        if s not in types or p == RDF_TYPE:
+            continue
+        if o in types:
+            domain, range_ = relations[p]
+            domain.update(to_neo4j(t) for t in types[s])
+            range_.update(to_neo4j(t) for t in types[o])
+        elif o.startswith("http"):
+            domain, range_ = relations[p]
+            domain.update(to_neo4j(t) for t in types[s])
+            range_.add("Resource")
+        elif p != RDFS_LABEL:
+            for entity_type in types[s]:
+                properties[entity_type].add(to_neo4j(p))
+
+    lines = ["### Graph Schema", "", "**Node labels** (subclass chain; sample `rdfs__label` values; other literal properties):"]
+    for entity_type in sorted(instances, key=to_neo4j):
+        chain, parent = [], parents.get(entity_type)
+        while parent and parent not in chain:
+            chain.append(parent)
+            parent = parents.get(parent)
+        samples = sorted(labels.get(e, to_neo4j(e)) for e in instances[entity_type])[:3]
+        line = f"- `{to_neo4j(entity_type)}`"
+        if chain:
+            line += " < " + " < ".join(re.split(r"[#/]", c)[-1] for c in chain)
+        line += "; " + ", ".join(f'"{sample}"' for sample in samples)
+        if properties[entity_type]:
+            line += "; " + ", ".join(sorted(properties[entity_type]))
+        lines.append(line)
+
+    lines += ["", "**Relationships:**"]
+    for relation in sorted(relations, key=to_neo4j):
+        domain, range_ = relations[relation]
+        lines.append(f"- `({' | '.join(sorted(domain))}) -[:{to_neo4j(relation)}]-> ({' | '.join(sorted(range_))})`")
+
+    lines += ["", "Every node has the `Resource` label, a `uri` property holding its full URI and usually an `rdfs__label`."]
+    return "\n".join(lines)
+
+
+def build_system_prompt(triples: list) -> str:
+    """
+    Builds the static part of the translation prompt.
+
+    The returned string only depends on the knowledge base, so it is byte-identical across
+    requests and can be served from the provider's prompt prefix cache.
+
+    Args:
+        triples (list): The (subject, predicate, object) triples of the knowledge base.
+
+    Returns:
+        str: The system prompt with the instructions and the graph schema.
+    """
+    return f"{INSTRUCTIONS}\n\n{build_schema(triples)}\n"
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits a text into lowercase word unigrams and character trigrams.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        list: The extracted features.
+    """
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    trigrams = [word[i:i + 3] for word in words if len(word) > 3 for i in range(len(word) - 2)]
+    return words + trigrams
+
+
+def embed(text: str, idf: dict) -> dict:
+    """
+    Computes the L2-normalized sparse TF-IDF vector of a text.
+
+    Args:
+        text (str): The text to embed.
+        idf (dict): Inverse document frequency of each feature.
+
+    Returns:
+        dict: A mapping from feature to weight.
+    """
+    counts = Counter(tokenize(text))
+    vector = {feature: count * idf.get(feature, 0.0) for feature, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {feature: weight / norm for feature, weight in vector.items()} if norm > 0 else {}
+
+
+def build_example_index(examples: list) -> dict:
+    """
+    Precomputes the embeddings of the example questions used for few-shot selection.
+
+    Args:
+        examples (list): A list of dictionaries with the "question" and "cypher" keys.
+
+    Returns:
+        dict: The examples together with their IDF table and vectors.
+    """
+    document_frequency = Counter()
+    for example in examples:
+        document_frequency.update(set(tokenize(example["question"])))
+    idf = {feature: math.log((1 + len(examples)) / (1 + df)) + 1 for feature, df in document_frequency.items()}
+    vectors = [embed(example["question"], idf) for example in examples]
+    return {"examples": examples, "idf": idf, "vectors": vectors}
+
+
+def load_example_index(file_path: str) -> dict:
+    """
+    Loads the example bank from a JSON file and indexes it.
+
+    Args:
+        file_path (str): Path to the JSON example bank.
+
+    Returns:
+        dict: The example index.
+    """
+    with open(file_path, "r") as f:
+        return build_example_index(json.load(f))
+
+
+def select_examples(question: str, index: dict, k: int) -> list:
+    """
+    Selects the k examples whose questions are the most similar to the given one.
+
+    Args:
+        question (str): The user's natural language question.
+        index (dict): The example index built by `build_example_index`.
+        k (int): The number of examples to return.
+
+    Returns:
+        list: The selected examples, most similar first.
+    """
+    query = embed(question, index["idf"])
+    scores = [
+        sum(weight * vector.get(feature, 0.0) for feature, weight in query.items())
+        for vector in index["vectors"]
+    ]
+    ranking = sorted(range(len(scores)), key=lambda i: (-scores[i], i))[:k]
+    return [index["examples"][i] for i in ranking]
+
+
+def build_messages(question: str, system_prompt: str, index: dict, k: int) -> list:
+    """
+    Assembles the chat messages for a translation request.
+
+    The system prompt comes first and never changes, the selected examples and the question follow it.
+
+    Args:
+        question (str): The user's natural language question.
+        system_prompt (str): The static system prompt.
+        index (dict): The example index.
+        k (int): The number of few-shot examples to include.
+
+    Returns:
+        list: The chat messages to send to the language model.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    for example in select_examples(question, index, k):
+        messages.append({"role": "user", "content": f"Question:\n{example['question']}"})
+        messages.append({"role": "assistant", "content": example["cypher"]})
+    messages.append({"role": "user", "content": f"Question:\n{question}"})
+    return messages
+
+
+def example_bank_path() -> str:
+    """
+    Returns the path of the example bank, defaulting to the one shipped with the service.
+    """
+    return os.getenv("EXAMPLES_FILE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples.json"))
@@ -1,28 +1,38 @@
-from fastapi import FastAPI
+from fastapi import Response
 from pydantic import BaseModel
-import os
-from langchain_openai import ChatOpenAI
+from typing import List, Optional
+from common.answer_cache import answer_cache_from_env, context_fingerprint
+from common.cache_backend import cache_from_env
+from common.llm_gateway import gateway_from_env
+from common.service import create_app
 
-# Initialize the FastAPI app
-app = FastAPI()
+# Cache backend shared by all the workers
+cache = cache_from_env()
+
+# Initialize the FastAPI app with health endpoints
+app = create_app(checks=[cache.ping], on_shutdown=[cache.close])
 
 # Define the request payload model
 class ResponseRequest(BaseModel):
     """
     Request model containing the user's question and the associated context.
+
+    The optional triples and KB version identify the context for the answer cache;
+    without triples the lines of the formatted context are used instead.
     """
     question: str
     context: str
+    triples: Optional[List[List[str]]] = None
+    kb_version: str = ""
+
+# Language model behind the gateway that rate-limits, retries and coalesces the calls
+llm = gateway_from_env()
 
-# Initialize the OpenAI language model
-llm = ChatOpenAI(
-    temperature=0,  # Deterministic output for reproducible results
-    api_key=os.getenv("OPENAI_API_TOKEN"), # Load API key from environment
-    model="gpt-4o-mini" # Use a lightweight GPT-4 variant
-)
+# Answers already generated for the same question over the same context
+answer_cache = answer_cache_from_env(cache)
 
 @app.post("/generate")
-async def generate_response(request: ResponseRequest):
+async def generate_response(request: ResponseRequest, response: Response):
     """
     Endpoint that generates a context-aware answer to a cybersecurity-related question.
 
@@ -35,8 +45,17 @@ async def generate_response(request: ResponseRequest):
 
     Returns:
         dict: A dictionary with a single key "answer" containing the model's response.
+        The X-Answer-Cache header tells whether it was served from the answer cache.
     """
-    
+    triples = request.triples if request.triples is not None else request.context.splitlines()
+    fingerprint = context_fingerprint(triples, request.kb_version)
+
+    answer, status, age = answer_cache.get(request.question, fingerprint)
+    response.headers["X-Answer-Cache"] = status
+    if answer is not None:
+        response.headers["Age"] = str(int(age))
+        return {"answer": answer}
+
     # Define the prompt used to guide the language model's behavior
     prompt = [
         {"role": "system", "content": """
@@ -51,8 +70,9 @@ async def generate_response(request: ResponseRequest):
         {"role": "user", "content": f"Context: {request.context}\n\nQuestion: {request.question}"}
     ]
 
-    # Invoke the language model with the crafted prompt
-    response = llm.invoke(prompt)
+    # Invoke the language model without blocking the worker's event loop
+    answer = (await llm.ainvoke(prompt)).content.strip()
+    answer_cache.put(request.question, fingerprint, answer)
 
     # Return the cleaned answer
-    return {"answer": response.content.strip()}
+    return {"answer": answer}
@@ -2,9 +2,16 @@ import streamlit as st
 import requests
 import os
 import re
-import pickle
-from langchain_neo4j import Neo4jGraph
-from langchain_openai import ChatOpenAI
+import uuid
+from common.answer_cache import MISS, kb_version
+from common.lazy import lazy_import
+from common.llm_gateway import BATCH, gateway_from_env
+from common.session_context import entity_vocabulary, is_follow_up, session_store_from_env
+from template_matcher import load_template_index, match_template
+
+# Heavy dependencies are loaded on first use, keeping the app's cold start short
+langchain_neo4j = lazy_import("langchain_neo4j")
+triple_table = lazy_import("common.triple_table")
 
 def format_results(results):
     """
@@ -64,24 +71,109 @@ def extract_name(url):
             return re.split(r'[#/]', url)[-1]
     return url
 
-def search(cypher_query):
+@st.cache_resource
+def get_graph():
     """
-    Executes a Cypher query on the Neo4j graph and returns URIs and triples.
+    Connects to the Neo4j graph once per process.
 
-    Args:
-        cypher_query (str): The Cypher query to execute.
-    
     Returns:
-        tuple: (uris, triples, original_query)
+        Neo4jGraph: The shared graph client.
     """
-    kg = Neo4jGraph(
+    return langchain_neo4j.Neo4jGraph(
         url=os.getenv("NEO4J_URI"),
         username=os.getenv("NEO4J_USERNAME"),
         password=os.getenv("NEO4J_PASSWORD"),
         database="neo4j"
     )
+
+@st.cache_resource
+def get_llm():
+    """
+    Creates the LLM gateway once per process, so that all the sessions share its rate limits and in-flight calls.
+
+    Returns:
+        LLMGateway: The shared LLM gateway.
+    """
+    return gateway_from_env()
+
+@st.cache_resource
+def load_triples(file_path):
+    """
+    Loads the knowledge base once per process into a compact triple table, with the entity names already shortened.
+
+    Args:
+        file_path (str): Path to the knowledge base pickle file.
+
+    Returns:
+        TripleTable: The (subject, predicate, object) triples with shortened names.
+    """
+    return triple_table.TripleTable.from_pickle(file_path, shorten=extract_name)
+
+@st.cache_resource
+def get_session_store():
+    """
+    Creates the store of the conversation contexts shared by all the sessions of the process.
+
+    Returns:
+        SessionContextStore: The session context store.
+    """
+    return session_store_from_env()
+
+@st.cache_resource
+def get_template_index(file_path, version):
+    """
+    Loads the precomputed answers of the frequent question templates once per knowledge base version.
+
+    Args:
+        file_path (str): Path to the template index.
+        version (str): Version of the knowledge base the app is serving.
+
+    Returns:
+        dict or None: The template index, or None if it is missing, was built from another knowledge base
+        or predates the materialized entity triples.
+    """
+    if not file_path or not os.path.exists(file_path):
+        return None
+    index = load_template_index(file_path)
+    return index if index["kb_version"] == version and "entity_triples" in index else None
+
+@st.cache_resource
+def get_entity_vocabulary(file_path):
+    """
+    Collects the names and labels of the knowledge base entities once per process.
+
+    Args:
+        file_path (str): Path to the knowledge base pickle file.
+
+    Returns:
+        set: The compacted entity names, used to tell follow-up questions from new ones.
+    """
+    return entity_vocabulary(load_triples(file_path))
+
+def load_entity_triples(entity_names):
+    """
+    Collects the triples of several entities from the inverted index of the knowledge base.
+
+    Args:
+        entity_names (list): Shortened entity names.
+
+    Returns:
+        dict: A mapping from each entity name to the triples where it is the subject or the object.
+    """
+    table = load_triples(os.getenv("KB_PICKLE_FILE_PATH"))
+    return {name: table.find(name, positions=(0, 2)) for name in entity_names}
+
+def search(cypher_query):
+    """
+    Executes a Cypher query on the Neo4j graph and returns URIs and triples.
+
+    Args:
+        cypher_query (str): The Cypher query to execute.
     
-    result = kg.query(cypher_query)
+    Returns:
+        tuple: (uris, triples, original_query)
+    """
+    result = get_graph().query(cypher_query)
     uris, triples = [], []
 
     for entry in result:
@@ -92,12 +184,16 @@ def search(cypher_query):
 
     return uris, triples, cypher_query
 
-def get_context(response):
+def get_context(response, session):
     """
     Retrieves contextual triples from the graph or a fallback pickle file.
 
+    The triples of entities already resolved in the conversation are reused,
+    only the ones of new entities are fetched.
+
     Args:
         response (str): Cypher query or raw response text.
+        session (SessionContext): The conversation context of the user session.
     
     Returns:
         tuple: (uris, context_triples, cypher_query)
@@ -107,23 +203,11 @@ def get_context(response):
 
     if triples:
         context.extend(triples)
+        session.remember(list(dict.fromkeys(name for triple in triples for name in (triple[0], triple[2]))))
     else:
-        with open(os.getenv("KB_PICKLE_FILE_PATH"), "rb") as f:
-            train_triples, valid_triples, test_triples = pickle.load(f)
-
-        all_triples = train_triples + valid_triples + test_triples
-
-        processed_triples = [
-            (extract_name(triple[0]), extract_name(triple[1]), extract_name(triple[2])) 
-            for triple in all_triples
-        ]
-
-        for entity_name in results:
-            filtered_triples = [
-                triple for triple in processed_triples
-                if extract_name(entity_name) in (triple[0], triple[2])
-            ]
-            context.append(filtered_triples)
+        entity_names = [extract_name(entity_name) for entity_name in results]
+        entity_triples, _ = session.fetch(entity_names, load_entity_triples)
+        context.extend(entity_triples[name] for name in entity_names)
 
     return results, context, cypher_query
 
@@ -131,18 +215,15 @@ def generate_LLM_answer(question: str):
     """
     Calls the LLM directly for a general answer (outside main pipeline).
 
+    It is only shown for comparison, so it goes through the batch lane of the gateway.
+
     Args:
         question (str): The user's natural language question.
     
     Returns:
         str: The LLM-generated response.
     """
-    llm = ChatOpenAI(
-        temperature=0,
-        api_key=os.getenv("OPENAI_API_TOKEN"),
-        model="gpt-4o-mini"
-    )
-    response = llm.invoke(question)
+    response = get_llm().invoke(question, priority=BATCH)
     return response.content
 
 # --- Streamlit UI ---
@@ -153,6 +234,8 @@ st.write("I am here to help you!")
 # Initialize chat message history
 if "messages" not in st.session_state:
     st.session_state["messages"] = []
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
 
 # Render chat history
 for msg in st.session_state["messages"]:
@@ -166,37 +249,69 @@ if user_input := st.chat_input("Enter your question..."):
     with st.chat_message("user"):
         st.markdown(user_input)
 
-    # Query translation service (NL → Cypher)
-    response = requests.post("http://query_translator:8000/translate", json={"question": user_input})
-    cypher_query = response.json().get("cypher_query")
+    session = get_session_store().get(st.session_state["session_id"])
+    version = kb_version(os.getenv("KB_PICKLE_FILE_PATH"))
+    template_index = get_template_index(os.getenv("TEMPLATE_INDEX_PATH"), version)
+    template_answer = match_template(user_input, template_index) if template_index else None
+
+    if template_answer:
+        # Frequent templates are answered from the precomputed index, without translation nor graph query.
+        # The index holds the same triples the full pipeline fetches for the entities of the answer.
+        results, cypher_query = template_answer["entities"], template_answer["cypher"]
+        entity_names = [extract_name(uri) for uri in results]
+        entity_triples, _ = session.fetch(entity_names, lambda missing: {
+            name: [tuple(triple) for triple in template_index["entity_triples"].get(name, [])] for name in missing
+        })
+        context = [entity_triples[name] for name in entity_names]
+        session.remember([extract_name(template_answer["entity"])])
+    elif is_follow_up(user_input, get_entity_vocabulary(os.getenv("KB_PICKLE_FILE_PATH"))) and session.recent_entities():
+        # Follow-ups about the entities of the previous turns are answered from their stored subgraph,
+        # without translation nor graph query
+        results = session.recent_entities()
+        entity_triples, _ = session.fetch(results, load_entity_triples)
+        context = [entity_triples[name] for name in results]
+        cypher_query = f"// Answered from the entities of the previous turns: {', '.join(results)}"
+    else:
+        # Query translation service (NL → Cypher)
+        response = requests.post("http://query_translator:8000/translate", json={"question": user_input})
+        cypher_query = response.json().get("cypher_query")
 
-    # Retrieve context and triples
-    results, context, cypher_query = get_context(cypher_query)
+        # Retrieve context and triples
+        results, context, cypher_query = get_context(cypher_query, session)
 
     # Format results
     formatted_context = format_results(results) if results else ""
     formatted_triples = format_triples(context, flag=1 if results else 0)
 
-    # Response generation service
-    response = requests.post("http://response_generator:8000/generate", json={"question": user_input, "context": formatted_triples})
+    # Response generation service, which may serve the answer from its cache
+    context_triples = [list(triple) for group in context for triple in group] if results else [list(triple) for triple in context]
+    response = requests.post("http://response_generator:8000/generate", json={
+        "question": user_input,
+        "context": formatted_triples,
+        "triples": context_triples,
+        "kb_version": version
+    })
     answer = response.json().get("answer", "")
-
-    # Generate LLM-based response
-    llm_answer = generate_LLM_answer(user_input)
+    cache_status = response.headers.get("X-Answer-Cache", MISS)
 
     # Display AI assistant's main response
     with st.chat_message("assistant"):
         st.markdown(answer)
+        if cache_status != MISS:
+            st.caption("⚡ Answer served from cache")
     
     # Save assistant response to chat history
     st.session_state["messages"].append({"role": "assistant", "content": answer})
 
     # Expandable sections for additional details
-    with st.expander("🔍 Show LLM Answer"):
-        st.markdown(llm_answer)
+    llm_expander = st.expander("🔍 Show LLM Answer")
 
     with st.expander("📚 Show Context"):
         st.markdown(formatted_context + formatted_triples)
 
     with st.expander("📊 Show Generated Cypher Query"):
         st.code(cypher_query, language="cypher")
+
+    # Generate LLM-based response last: it waits in the batch lane, so everything else is shown first
+    with llm_expander:
+        st.markdown(generate_LLM_answer(user_input))
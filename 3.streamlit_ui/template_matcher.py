@@ -0,0 +1,63 @@
+import re
+import json
+
+
+def compact(text):
+    """
+    Normalizes an entity name or alias so that spacing, case and punctuation do not matter.
+
+    Args:
+        text (str): The part of a question naming an entity.
+
+    Returns:
+        str: The lowercased alphanumeric characters of the text.
+    """
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+
+def load_template_index(file_path):
+    """
+    Loads the template index materialized by the knowledge base job and compiles its patterns.
+
+    Args:
+        file_path (str): Path to the template index.
+
+    Returns:
+        dict: The index, with its template patterns compiled.
+    """
+    with open(file_path) as f:
+        index = json.load(f)
+    index["templates"] = {
+        name: [re.compile(pattern) for pattern in patterns]
+        for name, patterns in index["templates"].items()
+    }
+    index["entity_affixes"] = re.compile(index["entity_affixes"])
+    return index
+
+
+def match_template(question, index):
+    """
+    Answers a question from the precomputed index when it follows a known template about a known entity.
+
+    Args:
+        question (str): The user's natural language question.
+        index (dict): The template index returned by load_template_index.
+
+    Returns:
+        dict or None: The template name, the entity URI, the URIs of the entities answering it and
+        the equivalent Cypher query, or None if the question must go through the full pipeline.
+    """
+    text = re.sub(r"\s+", " ", question.strip().lower()).rstrip("?.! ")
+    for name, patterns in index["templates"].items():
+        for pattern in patterns:
+            match = pattern.match(text)
+            if not match:
+                continue
+            phrase = match.group("entity")
+            # Try the captured phrase as is, then without articles and words like "attack" around the name
+            for candidate in (phrase, index["entity_affixes"].sub("", phrase)):
+                for entity in index["aliases"].get(compact(candidate), []):
+                    answer = index["answers"][name].get(entity)
+                    if answer is not None:
+                        return {"template": name, "entity": entity, **answer}
+    return None
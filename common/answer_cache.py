@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import math
+import time
+import hashlib
+from collections import Counter
+from common.cache_backend import cache_from_env
+
+STOPWORDS = {
+    "a", "an", "and", "are", "can", "do", "does", "for", "how", "i", "in", "is", "it", "me",
+    "my", "of", "on", "the", "to", "what", "which", "with", "you",
+}
+
+# Words giving the intent of a question. Questions differing only by them ("how can I mitigate X" and
+# "how can I detect X") are close in a bag of words, but must never share an answer
+INTENT_TERMS = {
+    "mitigate": {"mitigate", "mitigates", "mitigated", "mitigating", "mitigation", "mitigations",
+                 "prevent", "prevents", "defend", "protect", "block", "stop"},
+    "detect": {"detect", "detects", "detected", "detecting", "detection", "detections", "identify", "spot", "monitor"},
+    "uses": {"use", "uses", "used", "using", "exploit", "exploits", "exploited", "leverage", "leverages"},
+    "contains": {"contain", "contains", "contained", "inside", "part"},
+    "negation": {"not", "no", "never", "without", "cannot", "dont", "doesnt", "isnt"},
+}
+
+# Cache status values, also exposed to the UI through the X-Answer-Cache header
+HIT = "HIT"
+SEMANTIC_HIT = "SEMANTIC_HIT"
+MISS = "MISS"
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalizes a question so that trivially different spellings share a cache entry.
+
+    Args:
+        question (str): The user's natural language question.
+
+    Returns:
+        str: The lowercased question without punctuation and redundant whitespace.
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+
+
+_kb_versions = {}
+
+
+def kb_version(file_path: str) -> str:
+    """
+    Computes a short content hash of the knowledge base file, recomputed only when the file changes.
+
+    Args:
+        file_path (str): Path to the knowledge base pickle file.
+
+    Returns:
+        str: The first 16 hex digits of the SHA-256 of the file, or an empty string if it does not exist.
+    """
+    if not file_path or not os.path.exists(file_path):
+        return ""
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    if key not in _kb_versions:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _kb_versions[key] = digest.hexdigest()[:16]
+    return _kb_versions[key]
+
+
+def context_fingerprint(triples, version: str = "") -> str:
+    """
+    Hashes the retrieved context independently of the order in which it was retrieved.
+
+    Args:
+        triples (iterable): The context triples (any sequence of names), or the lines of a formatted context.
+        version (str): The knowledge base version the context was retrieved from.
+
+    Returns:
+        str: A hex digest identifying the context.
+    """
+    rows = sorted(json.dumps(t) if isinstance(t, str) else json.dumps(list(t)) for t in triples)
+    digest = hashlib.sha256(version.encode())
+    for row in rows:
+        digest.update(b"\n" + row.encode())
+    return digest.hexdigest()
+
+
+def _vectorize(normalized_question: str) -> Counter:
+    return Counter(token for token in normalized_question.split() if token not in STOPWORDS)
+
+
+def _intents(normalized_question: str) -> frozenset:
+    tokens = set(normalized_question.split())
+    return frozenset(intent for intent, terms in INTENT_TERMS.items() if tokens & terms)
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    dot = sum(count * b[token] for token, count in a.items())
+    norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values()))
+    return dot / norm if norm > 0 else 0.0
+
+
+class AnswerCache:
+    """
+    Cache of generated answers keyed on the normalized question and the context fingerprint.
+
+    Entries live in a Redis-compatible backend, so every worker sharing the backend shares the cache,
+    and the backend bounds its size. When a semantic threshold is given, a question missing the exact
+    lookup can still be served by a cached answer for the same context whose question is similar enough
+    and has the same intent (see INTENT_TERMS).
+    """
+
+    MAX_QUESTIONS_PER_CONTEXT = 64
+
+    def __init__(self, backend, semantic_threshold: float = None, ttl: int = None):
+        self.backend = backend
+        self.semantic_threshold = semantic_threshold
+        self.ttl = ttl
+
+    def get(self, question: str, fingerprint: str):
+        """
+        Looks up a cached answer.
+
+        Args:
+            question (str): The user's natural language question.
+            fingerprint (str): The fingerprint of the retrieved context.
+
+        Returns:
+            tuple: (answer, status, age in seconds), with a None answer on a miss.
+        """
+        normalized = normalize_question(question)
+        entry, status = self.backend.get(self._key(fingerprint, normalized)), HIT
+        if entry is None and self.semantic_threshold is not None:
+            candidate = self._closest(normalized, fingerprint)
+            if candidate is not None:
+                entry, status = self.backend.get(self._key(fingerprint, candidate)), SEMANTIC_HIT
+        if entry is None:
+            return None, MISS, 0.0
+        entry = json.loads(entry)
+        return entry["answer"], status, time.time() - entry["created"]
+
+    def put(self, question: str, fingerprint: str, answer: str) -> None:
+        """
+        Stores an answer.
+
+        Args:
+            question (str): The user's natural language question.
+            fingerprint (str): The fingerprint of the retrieved context.
+            answer (str): The generated answer.
+        """
+        normalized = normalize_question(question)
+        entry = json.dumps({"answer": answer, "created": time.time()})
+        self.backend.set(self._key(fingerprint, normalized), entry, ex=self.ttl)
+        if self.semantic_threshold is not None:
+            # Questions already answered over this context, scanned by the semantic match
+            questions = self._questions(fingerprint)
+            if normalized not in questions:
+                questions = (questions + [normalized])[-self.MAX_QUESTIONS_PER_CONTEXT:]
+                self.backend.set(f"answer-questions:{fingerprint}", json.dumps(questions), ex=self.ttl)
+
+    @staticmethod
+    def _key(fingerprint: str, normalized: str) -> str:
+        digest = hashlib.sha256(normalized.encode()).hexdigest()
+        return f"answer:{fingerprint}:{digest}"
+
+    def _questions(self, fingerprint: str) -> list:
+        questions = self.backend.get(f"answer-questions:{fingerprint}")
+        return json.loads(questions) if questions is not None else []
+
+    def _closest(self, normalized: str, fingerprint: str):
+        query, intents = _vectorize(normalized), _intents(normalized)
+        best, best_score = None, self.semantic_threshold
+        for candidate in self._questions(fingerprint):
+            if _intents(candidate) != intents:
+                continue
+            score = _cosine(query, _vectorize(candidate))
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+
+def answer_cache_from_env(backend=None) -> AnswerCache:
+    """
+    Creates an answer cache configured through the ANSWER_CACHE_* environment variables.
+
+    Args:
+        backend (object): The cache backend, by default the one configured through CACHE_URL.
+
+    Returns:
+        AnswerCache: The configured cache.
+    """
+    threshold = os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD")
+    ttl = os.getenv("ANSWER_CACHE_TTL")
+    return AnswerCache(
+        backend if backend is not None else cache_from_env(),
+        semantic_threshold=float(threshold) if threshold else None,
+        ttl=int(ttl) if ttl else None,
+    )
@@ -0,0 +1,279 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+
+# Refills and consumes several token buckets atomically. KEYS are the bucket names, ARGV the current
+# time followed by a (rate, capacity, amount) triple per bucket. Returns the seconds to wait, as a
+# string, and consumes nothing unless every bucket holds its amount.
+REDIS_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wait, states = 0, {}
+for i, key in ipairs(KEYS) do
+    local rate, capacity = tonumber(ARGV[3 * i - 1]), tonumber(ARGV[3 * i])
+    local amount = math.min(tonumber(ARGV[3 * i + 1]), capacity)
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens, updated = tonumber(state[1]) or capacity, tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    wait = math.max(wait, (amount - tokens) / rate)
+    states[i] = {tokens, amount, capacity / rate}
+end
+for i, key in ipairs(KEYS) do
+    local tokens = states[i][1]
+    if wait <= 0 then tokens = tokens - states[i][2] end
+    redis.call('HSET', key, 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', key, math.ceil(states[i][3]) + 60)
+end
+return tostring(math.max(0, wait))
+"""
+
+
+def _to_bytes(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryCache:
+    """
+    In-process LRU store exposing the subset of the Redis client API used by the services.
+
+    It is only shared between the threads of a single worker.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ex: int = None) -> bool:
+        with self.lock:
+            self.entries[key] = (_to_bytes(value), time.time() + ex if ex else None)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        with self.lock:
+            return sum(self.entries.pop(key, None) is not None for key in keys)
+
+    def ping(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteCache:
+    """
+    Local stand-in for Redis backed by a SQLite file, shared by every worker process that opens it.
+
+    Entries are evicted in least recently used order once the store holds more than max_entries keys.
+    The last access of an entry is recorded with a resolution of ACCESS_RESOLUTION seconds, so that
+    most reads do not take the write lock shared by all the workers.
+    """
+
+    EVICTION_INTERVAL = 64
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, accessed REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so each thread opens its own
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def get(self, key: str):
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute("SELECT value, expires, accessed FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        if expires is not None and expires < now:
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        if now - accessed >= self.ACCESS_RESOLUTION:
+            connection.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value, ex: int = None) -> bool:
+        connection = self._connection()
+        now = time.time()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+            (key, _to_bytes(value), now + ex if ex else None, now),
+        )
+        # Eviction scans the access index, so it runs once every EVICTION_INTERVAL writes
+        self.local.writes = getattr(self.local, "writes", 0) + 1
+        if self.local.writes % self.EVICTION_INTERVAL == 0:
+            connection.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        return True
+
+    def acquire(self, demands: list, now: float) -> float:
+        """
+        Refills token buckets shared by every process opening the file, and consumes from all of them
+        at once if they all hold the requested amounts.
+
+        Args:
+            demands (list): (bucket name, rate per second, capacity, amount) tuples.
+            now (float): The current wall-clock time, common to the processes of the host.
+
+        Returns:
+            float: 0 if the amounts were consumed, otherwise the seconds to wait before trying again.
+        """
+        connection = self._connection()
+        # An immediate transaction takes the write lock first, so refill and consume are atomic
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            states, wait = [], 0.0
+            for name, rate, capacity, amount in demands:
+                row = connection.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                tokens = _refill(*row, now, rate, capacity) if row else capacity
+                amount = min(amount, capacity)
+                wait = max(wait, (amount - tokens) / rate)
+                states.append((name, tokens, amount))
+            connection.executemany(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                [(name, tokens - amount if wait <= 0 else tokens, now) for name, tokens, amount in states],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return max(0.0, wait)
+
+    def delete(self, *keys: str) -> int:
+        connection = self._connection()
+        return sum(connection.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount for key in keys)
+
+    def ping(self) -> bool:
+        self._connection().execute("SELECT 1").fetchone()
+        return True
+
+    def close(self) -> None:
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+class RedisTokenBuckets:
+    """
+    Token buckets kept in a Redis-compatible server, shared by every process connected to it.
+    """
+
+    def __init__(self, client):
+        self.script = client.register_script(REDIS_ACQUIRE_SCRIPT)
+
+    def acquire(self, demands: list, now: float) -> float:
+        """
+        Refills the buckets and consumes from all of them at once if they all hold the requested amounts.
+
+        Args:
+            demands (list): (bucket name, rate per second, capacity, amount) tuples.
+            now (float): The current wall-clock time.
+
+        Returns:
+            float: 0 if the amounts were consumed, otherwise the seconds to wait before trying again.
+        """
+        args = [now] + [value for _, rate, capacity, amount in demands for value in (rate, capacity, amount)]
+        return float(self.script(keys=[name for name, _, _, _ in demands], args=args))
+
+
+def token_buckets_from_url(url: str):
+    """
+    Creates the store of token buckets shared by the processes using the same backend URL.
+
+    Args:
+        url (str): A backend URL, as accepted by cache_from_url.
+
+    Returns:
+        object or None: A store exposing `acquire`, or None for `memory://`, whose state is per process.
+    """
+    backend = cache_from_url(url)
+    if isinstance(backend, MemoryCache):
+        return None
+    if isinstance(backend, SQLiteCache):
+        return backend
+    return RedisTokenBuckets(backend)
+
+
+def cache_from_url(url: str, max_entries: int = 10000):
+    """
+    Creates a cache backend from a URL.
+
+    Supported schemes are `memory://`, `sqlite:///relative/path.db` or `sqlite:////absolute/path.db`,
+    and `redis://` (requires the `redis` package).
+
+    Args:
+        url (str): The backend URL.
+        max_entries (int): The size bound of the memory and SQLite backends.
+
+    Returns:
+        object: A client exposing the `get`, `set`, `delete` and `ping` methods of the Redis API.
+    """
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryCache(max_entries)
+    if scheme == "sqlite":
+        return SQLiteCache(url[len("sqlite:///"):], max_entries)
+    if scheme in ("redis", "rediss", "unix"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The redis cache backend requires the 'redis' package.") from e
+        return redis.Redis.from_url(url)
+    raise ValueError(f"Unsupported cache backend URL '{url}'.")
+
+
+def cache_from_env():
+    """
+    Creates the cache backend configured through the CACHE_URL and CACHE_MAX_ENTRIES environment variables.
+
+    Returns:
+        object: The cache backend, an in-process memory store by default.
+    """
+    return cache_from_url(os.getenv("CACHE_URL", "memory://"), int(os.getenv("CACHE_MAX_ENTRIES", 10000)))
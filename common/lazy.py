@@ -0,0 +1,44 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access.
+
+    It is deliberately not a `ModuleType` nor registered in `sys.modules`: tools that scan the
+    loaded modules (such as `inspect.getmodule`, which Streamlit calls on its first element)
+    would otherwise trigger the import.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Returns a module whose import is deferred until it is first used.
+
+    Heavy dependencies imported this way do not slow down the start of the apps and
+    are only paid for by the code paths that actually use them.
+
+    Args:
+        name (str): The fully qualified module name.
+
+    Returns:
+        LazyModule: The lazily imported module.
+    """
+    return LazyModule(name)
@@ -0,0 +1,412 @@
+import os
+import time
+import json
+import heapq
+import random
+import asyncio
+import hashlib
+import itertools
+import threading
+import concurrent.futures
+from collections import Counter
+from common.cache_backend import token_buckets_from_url
+
+# Priority lanes: interactive questions are admitted before batch work waiting for the same budget
+INTERACTIVE = 0
+BATCH = 1
+
+# Status codes and exception names of the provider errors worth retrying
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+# Seconds of budget the rate limiter lets through at once: providers enforce their per-minute
+# limits over shorter windows, so a full minute of budget in one burst would still be rejected
+BURST_SECONDS = 1
+
+# Seconds after which a waiting batch request goes before the interactive ones, so that a steady
+# interactive load cannot hold it back indefinitely
+BATCH_MAX_WAIT = 10
+
+# How often a request that is not at the head of the queue checks again for its turn
+POLL_INTERVAL = 0.05
+
+
+class LeaderInterrupted(Exception):
+    """
+    Set on a shared call whose leader was interrupted before it completed: the identical requests
+    waiting for it start the call again instead of failing.
+    """
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` tokens per second, holding at most `capacity` tokens.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.time()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Returns how long to wait before `amount` tokens are available, refilling the bucket up to `now`.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class LocalTokenBuckets:
+    """
+    Token buckets held by the process, for gateways that do not share their limits with other processes.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+
+    def acquire(self, demands: list, now: float) -> float:
+        """
+        Refills the buckets and consumes from all of them at once if they all hold the requested amounts.
+
+        Args:
+            demands (list): (bucket name, rate per second, capacity, amount) tuples.
+            now (float): The current time.
+
+        Returns:
+            float: 0 if the amounts were consumed, otherwise the seconds to wait before trying again.
+        """
+        buckets = [(self.buckets.setdefault(name, TokenBucket(rate, capacity)), amount) for name, rate, capacity, amount in demands]
+        wait = max((bucket.wait_time(amount, now) for bucket, amount in buckets), default=0.0)
+        if wait == 0:
+            for bucket, amount in buckets:
+                bucket.consume(amount)
+        return wait
+
+
+def estimate_tokens(messages) -> int:
+    """
+    Roughly estimates the number of prompt tokens of a request, at four characters per token.
+
+    Args:
+        messages: The prompt, as a string or a list of messages.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return sum(len(content) for _, content in _normalize(messages)) // 4 + 1
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Tells whether a provider error is transient: rate limits, timeouts, connection and server errors.
+
+    Args:
+        error (Exception): The error raised by the provider.
+
+    Returns:
+        bool: True if the request may succeed when retried.
+    """
+    status_code = getattr(error, "status_code", None)
+    return status_code in RETRYABLE_STATUS_CODES or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def _retry_after(error: Exception):
+    # Delay requested by the provider, either on the error or in the headers of its response
+    retry_after = getattr(error, "retry_after", None)
+    response = getattr(error, "response", None)
+    if retry_after is None and response is not None:
+        retry_after = getattr(response, "headers", {}).get("retry-after")
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return None
+
+
+def _normalize(messages) -> list:
+    # Strings, (role, content) tuples, role/content dictionaries and LangChain messages as (role, content) pairs
+    if isinstance(messages, str):
+        return [("user", messages)]
+    normalized = []
+    for message in messages:
+        if isinstance(message, dict):
+            normalized.append((message["role"], message["content"]))
+        elif isinstance(message, tuple):
+            normalized.append((message[0], message[1]))
+        else:
+            normalized.append((message.type, message.content))
+    return normalized
+
+
+class LLMGateway:
+    """
+    Shared access to the chat model: rate limiting, retries, request coalescing and priority lanes.
+
+    Requests are admitted through request and token buckets sized on the provider limits, in priority
+    order, except that batch requests waiting for more than `batch_max_wait` seconds go first. Transient errors are retried with full-jitter exponential backoff, honoring the delay
+    requested by the provider. The buckets are shared with the other processes using the same `buckets`
+    store, and held by the process otherwise. Identical requests in flight at the same time share a single call,
+    which is not interrupted when the request that started it is cancelled.
+    """
+
+    def __init__(self, provider, requests_per_minute: float = 500, tokens_per_minute: float = 200000,
+                 max_retries: int = 5, base_delay: float = 0.5, max_delay: float = 20.0, buckets=None,
+                 batch_max_wait: float = BATCH_MAX_WAIT):
+        self.provider = provider
+        # (name, rate per second, capacity) of each bucket; the names identify the provider limits they share
+        model = getattr(provider, "model", getattr(provider, "model_name", ""))
+        self.request_bucket = (f"llm-bucket:{model}:requests", requests_per_minute / 60, max(1.0, requests_per_minute / 60 * BURST_SECONDS)) if requests_per_minute else None
+        self.token_bucket = (f"llm-bucket:{model}:tokens", tokens_per_minute / 60, tokens_per_minute / 60 * BURST_SECONDS) if tokens_per_minute else None
+        self.buckets = buckets if buckets is not None else LocalTokenBuckets()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = Counter()
+        self.queue = []
+        self.enqueued = {}
+        self.batch_max_wait = batch_max_wait
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+
+    def _request_key(self, messages) -> str:
+        payload = json.dumps([getattr(self.provider, "model", ""), _normalize(messages)])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _first_in_line(self) -> tuple:
+        # The head of the priority queue, unless the oldest batch request has waited for too long
+        head = self.queue[0]
+        if head[0] == INTERACTIVE:
+            waiting = [ticket for ticket in self.queue if ticket[0] != INTERACTIVE]
+            if waiting:
+                oldest = min(waiting, key=lambda ticket: ticket[1])
+                if time.monotonic() - self.enqueued[oldest] >= self.batch_max_wait:
+                    return oldest
+        return head
+
+    def _try_admit(self, ticket: tuple, cost: int) -> float:
+        # Called with the condition held: admits the ticket if it is the first in line and the
+        # buckets allow it, otherwise returns how long to wait before trying again
+        if self._first_in_line() != ticket:
+            return POLL_INTERVAL
+        demands = [(*bucket, amount) for bucket, amount in ((self.request_bucket, 1), (self.token_bucket, cost)) if bucket]
+        wait = self.buckets.acquire(demands, time.time()) if demands else 0.0
+        if wait > 0:
+            return wait
+        self.queue.remove(ticket)
+        heapq.heapify(self.queue)
+        del self.enqueued[ticket]
+        self.condition.notify_all()
+        return 0.0
+
+    def _enqueue(self, priority: int) -> tuple:
+        ticket = (priority, next(self.sequence))
+        with self.condition:
+            heapq.heappush(self.queue, ticket)
+            self.enqueued[ticket] = time.monotonic()
+        return ticket
+
+    def _dequeue(self, ticket: tuple) -> None:
+        # A request cancelled while waiting gives its place up
+        with self.condition:
+            if ticket in self.queue:
+                self.queue.remove(ticket)
+                heapq.heapify(self.queue)
+                del self.enqueued[ticket]
+                self.condition.notify_all()
+
+    def _admit(self, priority: int, cost: int) -> None:
+        ticket = self._enqueue(priority)
+        try:
+            with self.condition:
+                while (wait := self._try_admit(ticket, cost)) > 0:
+                    self.condition.wait(wait)
+        finally:
+            self._dequeue(ticket)
+
+    async def _aadmit(self, priority: int, cost: int) -> None:
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self.condition:
+                    wait = self._try_admit(ticket, cost)
+                if wait == 0:
+                    return
+                await asyncio.sleep(min(wait, POLL_INTERVAL))
+        finally:
+            self._dequeue(ticket)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        self.stats["retries"] += 1
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _call(self, messages, priority: int):
+        cost = estimate_tokens(messages)
+        for attempt in itertools.count():
+            self._admit(priority, cost)
+            try:
+                self.stats["calls"] += 1
+                return self.provider.invoke(messages)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                time.sleep(self._backoff(attempt, e))
+
+    async def _acall(self, messages, priority: int):
+        cost = estimate_tokens(messages)
+        for attempt in itertools.count():
+            await self._aadmit(priority, cost)
+            try:
+                self.stats["calls"] += 1
+                return await self.provider.ainvoke(messages)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    def _join(self, key: str):
+        # Returns the future of the identical request already in flight, or registers a new one
+        with self.in_flight_lock:
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, False
+            future = self.in_flight[key] = concurrent.futures.Future()
+            return future, True
+
+    def _settle(self, key: str, future, result=None, error: BaseException = None) -> None:
+        with self.in_flight_lock:
+            self.in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _settle_task(self, key: str, future, task) -> None:
+        # Done callback of the task running a shared async call
+        if task.cancelled():
+            self._settle(key, future, error=LeaderInterrupted())
+        elif task.exception() is not None:
+            self._settle(key, future, error=task.exception())
+        else:
+            self._settle(key, future, task.result())
+
+    def invoke(self, messages, priority: int = INTERACTIVE):
+        """
+        Sends a request to the chat model.
+
+        Args:
+            messages: The prompt, as a string or a list of messages.
+            priority (int): The lane of the request, INTERACTIVE or BATCH.
+
+        Returns:
+            The message returned by the provider, shared with the identical requests it was coalesced with.
+        """
+        key = self._request_key(messages)
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except LeaderInterrupted:
+                continue
+        try:
+            result = self._call(messages, priority)
+        except Exception as e:
+            self._settle(key, future, error=e)
+            raise
+        except BaseException:
+            # Interruptions such as a Streamlit rerun only stop this request: a follower takes the call over
+            self._settle(key, future, error=LeaderInterrupted())
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def ainvoke(self, messages, priority: int = INTERACTIVE):
+        """
+        Sends a request to the chat model without blocking the event loop.
+
+        Args:
+            messages: The prompt, as a string or a list of messages.
+            priority (int): The lane of the request, INTERACTIVE or BATCH.
+
+        Returns:
+            The message returned by the provider, shared with the identical requests it was coalesced with.
+        """
+        key = self._request_key(messages)
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                # The call runs in its own task, so that cancelling the request that started it
+                # does not cancel the identical requests waiting for its result
+                task = asyncio.ensure_future(self._acall(messages, priority))
+                task.add_done_callback(lambda task: self._settle_task(key, future, task))
+            try:
+                # Shielded: a cancelled request stops waiting without cancelling the shared future
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except LeaderInterrupted:
+                continue
+
+
+def provider_from_env():
+    """
+    Creates the chat model selected by LLM_PROVIDER: "openai" (default) or "mock".
+
+    Returns:
+        The chat model, exposing `invoke` and `ainvoke`.
+    """
+    name = os.getenv("LLM_PROVIDER", "openai")
+    if name == "openai":
+        from langchain_openai import ChatOpenAI
+        # Retries are handled by the gateway, so that they go through its rate limiter
+        return ChatOpenAI(
+            temperature=0,
+            api_key=os.getenv("OPENAI_API_TOKEN"),
+            model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
+            max_retries=0,
+        )
+    if name == "mock":
+        from common.mock_provider import MockProvider
+        rate_limit = os.getenv("MOCK_LLM_REQUESTS_PER_SECOND")
+        return MockProvider(
+            response=os.getenv("MOCK_LLM_RESPONSE"),
+            latency=float(os.getenv("MOCK_LLM_LATENCY", 0.05)),
+            requests_per_second=float(rate_limit) if rate_limit else None,
+            failure_rate=float(os.getenv("MOCK_LLM_FAILURE_RATE", 0.0)),
+        )
+    raise ValueError(f"Unknown LLM provider '{name}'.")
+
+
+def gateway_from_env(provider=None) -> LLMGateway:
+    """
+    Creates an LLM gateway configured through the LLM_* environment variables.
+
+    The rate limits are shared by every process whose LLM_RATE_LIMIT_URL points at the same SQLite file
+    or Redis server, and held by the process when it is unset or `memory://`.
+
+    Args:
+        provider: The chat model to use, by default the one selected by LLM_PROVIDER.
+
+    Returns:
+        LLMGateway: The configured gateway.
+    """
+    return LLMGateway(
+        provider if provider is not None else provider_from_env(),
+        requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", 500)),
+        tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", 200000)),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", 5)),
+        base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", 0.5)),
+        max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", 20)),
+        buckets=token_buckets_from_url(os.getenv("LLM_RATE_LIMIT_URL") or "memory://"),
+        batch_max_wait=float(os.getenv("LLM_BATCH_MAX_WAIT", BATCH_MAX_WAIT)),
+    )
@@ -0,0 +1,86 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+
+class MockMessage:
+    """
+    Chat completion returned by the mock provider, exposing the same `content` attribute as a LangChain message.
+    """
+
+    def __init__(self, content: str):
+        self.content = content
+
+    def __repr__(self) -> str:
+        return f"MockMessage(content={self.content!r})"
+
+
+class MockProviderError(Exception):
+    """
+    Error raised by the mock provider, carrying the HTTP status a real provider would return.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: float = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class MockProvider:
+    """
+    Local stand-in for the chat model, with configurable latency, a provider-side rate limit and random failures.
+
+    It lets the LLM gateway be exercised under load without calling, or paying for, the real provider.
+    """
+
+    model = "mock"
+
+    def __init__(self, response: str = None, latency: float = 0.05, requests_per_second: float = None,
+                 failure_rate: float = 0.0, seed: int = None):
+        self.response = response
+        self.latency = latency
+        self.requests_per_second = requests_per_second
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.rejected = 0
+        self.window = deque()
+        self.lock = threading.Lock()
+
+    def _admit(self, messages) -> MockMessage:
+        # Requests over the limit in the last second are rejected, as a 429 from the provider
+        with self.lock:
+            now = time.monotonic()
+            while self.window and now - self.window[0] >= 1.0:
+                self.window.popleft()
+            if self.requests_per_second and len(self.window) >= self.requests_per_second:
+                self.rejected += 1
+                raise MockProviderError("Rate limit exceeded", 429, retry_after=1.0 - (now - self.window[0]))
+            self.window.append(now)
+            self.calls += 1
+            if self.failure_rate and self.random.random() < self.failure_rate:
+                raise MockProviderError("Service unavailable", 503)
+        return MockMessage(self.response if self.response is not None else f"Mock answer to: {_last_content(messages)}")
+
+    def invoke(self, messages) -> MockMessage:
+        message = self._admit(messages)
+        time.sleep(self.latency)
+        return message
+
+    async def ainvoke(self, messages) -> MockMessage:
+        message = self._admit(messages)
+        await asyncio.sleep(self.latency)
+        return message
+
+
+def _last_content(messages) -> str:
+    if isinstance(messages, str):
+        return messages
+    last = messages[-1]
+    if isinstance(last, dict):
+        return last["content"]
+    if isinstance(last, tuple):
+        return last[1]
+    return last.content
@@ -0,0 +1,51 @@
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+
+
+def create_app(checks=(), on_shutdown=()) -> FastAPI:
+    """
+    Creates a FastAPI app with liveness and readiness endpoints.
+
+    In-flight requests are drained by uvicorn itself on shutdown: it stops accepting connections and
+    waits for the open ones up to `--timeout-graceful-shutdown` seconds before the lifespan ends.
+
+    Args:
+        checks (iterable): Callables that raise or return False when a dependency is not ready.
+        on_shutdown (iterable): Callables run once the in-flight requests have drained.
+
+    Returns:
+        FastAPI: The configured application.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        for callback in on_shutdown:
+            callback()
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/healthz")
+    async def liveness():
+        """
+        Liveness probe: the worker process is up and serving requests.
+        """
+        return {"status": "alive"}
+
+    @app.get("/readyz")
+    async def readiness(response: Response):
+        """
+        Readiness probe: the dependencies of the worker respond.
+        """
+        for check in checks:
+            try:
+                ready = check() is not False
+            except Exception as e:
+                ready = False
+                print(f"Readiness check failed: {e}")
+            if not ready:
+                response.status_code = 503
+                return {"status": "unavailable"}
+        return {"status": "ready"}
+
+    return app
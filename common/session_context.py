@@ -0,0 +1,244 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+# Follow-up questions refer back to the previous turn, either with a leading connective or with a
+# pronoun standing for the object of the question ("how do I mitigate it?", "what uses them?").
+# Pronouns in subject position ("how do they work?", "what might this be due to?") and determiners
+# ("is this traffic a DDoS attack?") are too ambiguous: such questions go through the full pipeline.
+FOLLOW_UP_CONNECTIVE = re.compile(r"^\s*(and|also|what about|how about|what else)\b", re.IGNORECASE)
+FOLLOW_UP_OBJECT = re.compile(
+    r"\b(mitigates?|mitigated|prevents?|stops?|blocks?|defend|protect|handle|remediate|patch|detects?|detected|"
+    r"identify|monitor|uses?|used|exploits?|exploited|contains?|targets?|targeted|affects?|affected|impacts?|"
+    r"about|against|of|for|with|by|to|from|in|on)\s+(it|them|this|these|those)"
+    r"(?=\s*(?:[?.!,]|$|\b(?:in|on|at|from|with|and|or|if|when|before|after)\b))",
+    re.IGNORECASE,
+)
+
+# Predicates whose objects are alternative names of their subject, and the ones defining classes
+LABEL_PREDICATES = {"label", "altLabel"}
+CLASS_PREDICATES = {"type", "subClassOf"}
+
+# Longest entity name looked for in a question, in words
+MAX_NAME_WORDS = 5
+
+
+def compact(text: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+
+def schema_names(triples) -> set:
+    """
+    Collects the names of the predicates and classes of the knowledge base, i.e. everything but its instances.
+
+    Args:
+        triples (iterable): (subject, predicate, object) triples.
+
+    Returns:
+        set: The predicate and class names.
+    """
+    predicates, classes = set(), set()
+    for s, p, o in triples:
+        predicates.add(p)
+        if p == "type":
+            classes.add(o)
+        elif p == "subClassOf":
+            classes.update((s, o))
+    return predicates | classes
+
+
+def entity_vocabulary(triples) -> set:
+    """
+    Collects the names and labels of the instances of the knowledge base, in compacted form.
+
+    Predicates and classes are left out: "uses" or "malware" in a question do not name an entity.
+
+    Args:
+        triples (iterable): (subject, predicate, object) triples with shortened names, iterated twice.
+
+    Returns:
+        set: The compacted entity names and labels.
+    """
+    excluded = schema_names(triples)
+    names = set()
+    for s, p, o in triples:
+        if s in excluded:
+            continue
+        names.add(s)
+        if p in LABEL_PREDICATES:
+            names.update(o.splitlines())
+    return {name for name in map(compact, names) if len(name) >= 3}
+
+
+def mentions_entity(question: str, vocabulary: set) -> bool:
+    """
+    Tells whether a question names an entity of the knowledge base.
+
+    Args:
+        question (str): The user's natural language question.
+        vocabulary (set): The compacted entity names returned by entity_vocabulary.
+
+    Returns:
+        bool: True if a sequence of words of the question is the name or label of an entity.
+    """
+    words = re.findall(r"[A-Za-z0-9]+", question)
+    return any(
+        compact("".join(words[start:start + length])) in vocabulary
+        for start in range(len(words))
+        for length in range(1, MAX_NAME_WORDS + 1)
+        if start + length <= len(words)
+    )
+
+
+def is_follow_up(question: str, vocabulary: set = None) -> bool:
+    """
+    Tells whether a question is a follow-up about the entities of the previous turns.
+
+    Args:
+        question (str): The user's natural language question.
+        vocabulary (set): The compacted entity names; a question naming one of them is not a follow-up.
+
+    Returns:
+        bool: True if the question refers back to the conversation without naming an entity, False
+        when unsure.
+    """
+    if not (FOLLOW_UP_CONNECTIVE.search(question) or FOLLOW_UP_OBJECT.search(question)):
+        return False
+    return not (vocabulary and mentions_entity(question, vocabulary))
+
+
+class SessionContext:
+    """
+    Entities resolved during a conversation, most recent last, with the triples fetched for each of them.
+
+    Entities that were only named by a previous turn are kept with `None` triples until they are fetched.
+    The size of a session counts one unit per entity plus one per stored triple.
+    """
+
+    def __init__(self, max_triples: int):
+        self.max_triples = max_triples
+        self.entities = OrderedDict()
+        self.size = 0
+        self.last_access = time.time()
+        self.lock = threading.Lock()
+
+    def recent_entities(self, limit: int = 5) -> list:
+        """
+        Returns the entities of the latest turns, most recent first.
+
+        Args:
+            limit (int): The maximum number of entities to return.
+
+        Returns:
+            list: The entity identifiers.
+        """
+        with self.lock:
+            return list(reversed(self.entities))[:limit]
+
+    def fetch(self, entities: list, loader) -> tuple:
+        """
+        Returns the triples of the given entities, calling the loader only for the ones not fetched yet.
+
+        Args:
+            entities (list): The entities resolved for the current turn.
+            loader (callable): Maps a list of entities to a dictionary from entity to its triples.
+
+        Returns:
+            tuple: (dictionary from entity to triples, number of entities reused from previous turns)
+        """
+        with self.lock:
+            missing = [entity for entity in dict.fromkeys(entities) if self.entities.get(entity) is None]
+        fetched = loader(missing) if missing else {}
+
+        with self.lock:
+            context = {}
+            for entity in entities:
+                triples = self.entities.get(entity)
+                if triples is None:
+                    triples = fetched.get(entity, [])
+                self._store(entity, triples)
+                context[entity] = triples
+            self._evict(keep=set(entities))
+        return context, len(dict.fromkeys(entities)) - len(missing)
+
+    def remember(self, entities: list) -> None:
+        """
+        Records entities resolved without fetching their triples, such as the nodes of a graph query result.
+
+        Args:
+            entities (list): The resolved entities.
+        """
+        with self.lock:
+            for entity in entities:
+                self._store(entity, self.entities.get(entity))
+            self._evict(keep=set(entities))
+
+    def _store(self, entity, triples) -> None:
+        # Moves the entity to the most recent position, keeping the size in step with its triples
+        if entity in self.entities:
+            self.size -= self._cost(self.entities.pop(entity))
+        self.entities[entity] = triples
+        self.size += self._cost(triples)
+
+    @staticmethod
+    def _cost(triples) -> int:
+        return 1 + len(triples or ())
+
+    def _evict(self, keep: set) -> None:
+        # Least recently used entities go first, but never the ones of the current turn
+        for entity in list(self.entities):
+            if self.size <= self.max_triples:
+                break
+            if entity not in keep:
+                self.size -= self._cost(self.entities.pop(entity))
+
+
+class SessionContextStore:
+    """
+    Per-session conversation contexts, bounded in size and evicted after a period of inactivity.
+    """
+
+    def __init__(self, max_triples_per_session: int = 5000, idle_timeout: float = 1800, max_sessions: int = 1000):
+        self.max_triples_per_session = max_triples_per_session
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id: str) -> SessionContext:
+        """
+        Returns the context of a session, creating it if needed, and evicts the idle sessions.
+
+        Args:
+            session_id (str): The identifier of the user session.
+
+        Returns:
+            SessionContext: The context of the session.
+        """
+        now = time.time()
+        with self.lock:
+            while self.sessions:
+                oldest_id, oldest = next(iter(self.sessions.items()))
+                if now - oldest.last_access < self.idle_timeout and len(self.sessions) < self.max_sessions:
+                    break
+                del self.sessions[oldest_id]
+            session = self.sessions.pop(session_id, None) or SessionContext(self.max_triples_per_session)
+            session.last_access = now
+            self.sessions[session_id] = session
+            return session
+
+
+def session_store_from_env() -> SessionContextStore:
+    """
+    Creates a session context store configured through the SESSION_* environment variables.
+
+    Returns:
+        SessionContextStore: The configured store.
+    """
+    return SessionContextStore(
+        max_triples_per_session=int(os.getenv("SESSION_MAX_TRIPLES", 5000)),
+        idle_timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", 1800)),
+        max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", 1000)),
+    )
@@ -0,0 +1,157 @@
+import sys
+import pickle
+from itertools import chain
+import numpy as np
+
+
+class Triple:
+    """
+    Read-only view of a row of a TripleTable, behaving like a (subject, predicate, object) tuple.
+    """
+
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row: int):
+        self.table = table
+        self.row = row
+
+    @property
+    def subject(self) -> str:
+        return self.table.pool[self.table.subjects[self.row]]
+
+    @property
+    def predicate(self) -> str:
+        return self.table.pool[self.table.predicates[self.row]]
+
+    @property
+    def object(self) -> str:
+        return self.table.pool[self.table.objects[self.row]]
+
+    def __getitem__(self, position: int) -> str:
+        return self.table.pool[self.table.columns[position][self.row]]
+
+    def __iter__(self):
+        return iter((self.subject, self.predicate, self.object))
+
+    def __len__(self) -> int:
+        return 3
+
+    def __contains__(self, name: str) -> bool:
+        return name in tuple(self)
+
+    def __eq__(self, other) -> bool:
+        return tuple(self) == tuple(other) if isinstance(other, (Triple, tuple, list)) else NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __repr__(self) -> str:
+        return repr(tuple(self))
+
+
+class TripleTable:
+    """
+    Triples stored as three int32 columns of identifiers into a pool of interned strings.
+
+    Each distinct name is stored once, and an inverted index in CSR layout gives the rows where a
+    name appears, so looking up the triples of an entity neither scans nor copies the knowledge base.
+    """
+
+    def __init__(self, pool: list, subjects, predicates, objects):
+        self.pool = pool
+        self.ids = {name: i for i, name in enumerate(pool)}
+        self.subjects = subjects
+        self.predicates = predicates
+        self.objects = objects
+        self.columns = (subjects, predicates, objects)
+
+        # Rows of each identifier, sorted, stored back to back: the rows of identifier i are
+        # index_rows[index_offsets[i]:index_offsets[i + 1]]
+        num_rows = len(subjects)
+        ids = np.concatenate(self.columns)
+        order = np.argsort(ids, kind="stable")
+        self.index_rows = np.tile(np.arange(num_rows, dtype=np.int32), 3)[order]
+        self.index_offsets = np.zeros(len(pool) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ids, minlength=len(pool)), out=self.index_offsets[1:])
+
+    @classmethod
+    def from_triples(cls, triples, shorten=None):
+        """
+        Builds a table from (subject, predicate, object) string triples.
+
+        Args:
+            triples (iterable): The triples, consumed once.
+            shorten (callable): Optional function applied to every name before it is stored.
+
+        Returns:
+            TripleTable: The table.
+        """
+        pool, ids = [], {}
+
+        def intern(name):
+            if shorten is not None:
+                name = shorten(name)
+            i = ids.get(name)
+            if i is None:
+                i = ids[name] = len(pool)
+                pool.append(sys.intern(name))
+            return i
+
+        flat = np.fromiter((intern(name) for triple in triples for name in triple), dtype=np.int32)
+        columns = flat.reshape(-1, 3).T
+        return cls(pool, *(np.ascontiguousarray(column) for column in columns))
+
+    @classmethod
+    def from_pickle(cls, file_path: str, shorten=None):
+        """
+        Builds a table from the knowledge base pickle, without concatenating its splits.
+
+        Args:
+            file_path (str): Path to the pickle file holding the (train, valid, test) triples.
+            shorten (callable): Optional function applied to every name before it is stored.
+
+        Returns:
+            TripleTable: The table.
+        """
+        with open(file_path, "rb") as f:
+            splits = pickle.load(f)
+        return cls.from_triples(chain.from_iterable(splits), shorten)
+
+    def __len__(self) -> int:
+        return len(self.subjects)
+
+    def __getitem__(self, row: int) -> Triple:
+        if not -len(self) <= row < len(self):
+            raise IndexError("triple index out of range")
+        return Triple(self, row % len(self))
+
+    def __iter__(self):
+        return (Triple(self, row) for row in range(len(self)))
+
+    def find(self, name: str, positions=(0, 1, 2)) -> list:
+        """
+        Returns the triples where a name appears.
+
+        Args:
+            name (str): The (shortened, if the table was built so) name to look up.
+            positions (tuple): The positions to match, 0 for subject, 1 for predicate, 2 for object.
+
+        Returns:
+            list: Triple views of the matching rows, in knowledge base order.
+        """
+        i = self.ids.get(name)
+        if i is None:
+            return []
+        rows = self.index_rows[self.index_offsets[i]:self.index_offsets[i + 1]]
+        if tuple(positions) != (0, 1, 2):
+            mask = np.zeros(len(rows), dtype=bool)
+            for position in positions:
+                mask |= self.columns[position][rows] == i
+            rows = rows[mask]
+        return [Triple(self, row) for row in np.unique(rows).tolist()]
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory held by the columns and the index, excluding the string pool.
+        """
+        return sum(column.nbytes for column in self.columns) + self.index_rows.nbytes + self.index_offsets.nbytes
@@ -5,8 +5,9 @@ import numpy as np
 import json
 import pickle
 from pykeen.triples import TriplesFactory
-from sklearn.linear_model import LinearRegression
+from sklearn.linear_model import LinearRegression, Ridge
 from langchain_openai import OpenAIEmbeddings
+from neighbors import build_neighbor_graph
 
 def extract_name(url):
     prefixes = [
@@ -31,6 +32,16 @@ def write_to_file(filename, data):
     with open(filename, 'w') as file:
         json.dump(data, file, indent=4)
 
+def local_alignment(texts, openai_vectors, model_name, output_path):
+    from fastembed import TextEmbedding
+    encoder = TextEmbedding(model_name=model_name)
+    local_vectors = np.array([normalize_vector(v) for v in encoder.embed(texts)])
+    openai_vectors = np.array([normalize_vector(v) for v in openai_vectors])
+    # Fewer names than local dimensions: regularize to keep the mapping usable on unseen questions
+    reg_local = Ridge(alpha=1.0)
+    reg_local.fit(local_vectors, openai_vectors)
+    np.savez(output_path, weight=reg_local.coef_.T.astype(np.float32), bias=reg_local.intercept_.astype(np.float32))
+
 def embeddings():
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     print(f"Using device: {device}")
@@ -82,6 +93,16 @@ def embeddings():
     aligned_entity_dict = {entity: (transE_entity_vectors[i] @ reg_entity.coef_.T).tolist() for i, entity in enumerate(common_entities)}
     write_to_file(os.getenv("ENTITY_EMBEDDINGS_PATH"), aligned_entity_dict)
     print("Entity embeddings aligned and saved!")
+
+    neighbor_graph_path = os.getenv("NEIGHBOR_GRAPH_PATH")
+    if neighbor_graph_path:
+        num_clusters = os.getenv("NEIGHBOR_CLUSTERS")
+        build_neighbor_graph(
+            os.getenv("ENTITY_EMBEDDINGS_PATH"),
+            neighbor_graph_path,
+            k=int(os.getenv("NEIGHBORS_K", 10)),
+            num_clusters=int(num_clusters) if num_clusters else None,
+        )
     
     common_relations = set(relation_embeddings_dict.keys()) & set(relation_embeddings_dict_openai.keys())
     transE_relation_vectors = np.array([normalize_vector(relation_embeddings_dict[r]) for r in common_relations])
@@ -93,5 +114,15 @@ def embeddings():
     write_to_file(os.getenv("RELATION_EMBEDDINGS_PATH"), aligned_relation_dict)
     print("Relation embeddings aligned and saved!")
 
+    local_alignment_path = os.getenv("LOCAL_ALIGNMENT_PATH")
+    if local_alignment_path:
+        local_alignment(
+            list(entity_to_id.keys()) + list(relation_to_id.keys()),
+            entity_embeddings_openai + relation_embeddings_openai,
+            os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5"),
+            local_alignment_path,
+        )
+        print("Local query embedding alignment saved!")
+
 if __name__ == "__main__":
     embeddings()
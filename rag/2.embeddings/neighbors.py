@@ -0,0 +1,101 @@
+import os
+import json
+import math
+import numpy as np
+
+# Rows of the similarity matrix computed at once: memory stays at block_size x num_entities floats
+BLOCK_SIZE = 1024
+
+
+def load_entity_vectors(path):
+    with open(path, 'r') as file:
+        embeddings_data = json.load(file)
+    matrix = np.array(list(embeddings_data.values()), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return list(embeddings_data.keys()), matrix / np.where(norms > 0, norms, 1)
+
+
+def blocks(num_rows, block_size):
+    for start in range(0, num_rows, block_size):
+        yield start, min(start + block_size, num_rows)
+
+
+def knn_graph(matrix, k, block_size=BLOCK_SIZE):
+    # Rows are unit-normalized, so each block of cosine similarities is a single matrix product
+    num_rows = len(matrix)
+    k = min(k, num_rows - 1)
+    neighbors = np.empty((num_rows, k), dtype=np.int32)
+    scores = np.empty((num_rows, k), dtype=np.float32)
+    for start, end in blocks(num_rows, block_size):
+        similarities = matrix[start:end] @ matrix.T
+        # An entity is not its own neighbor
+        similarities[np.arange(end - start), np.arange(start, end)] = -np.inf
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        neighbors[start:end] = np.take_along_axis(top, order, axis=1)
+        scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbors, scores
+
+
+def spherical_kmeans(matrix, num_clusters, iterations=50, block_size=BLOCK_SIZE, seed=0):
+    # k-means on the unit sphere: entities go to the centroid with the highest cosine similarity
+    rng = np.random.default_rng(seed)
+    num_rows = len(matrix)
+    num_clusters = min(num_clusters, num_rows)
+    centroids = matrix[rng.choice(num_rows, num_clusters, replace=False)]
+    labels = np.full(num_rows, -1, dtype=np.int32)
+    for _ in range(iterations):
+        new_labels = np.concatenate([
+            np.argmax(matrix[start:end] @ centroids.T, axis=1) for start, end in blocks(num_rows, block_size)
+        ]).astype(np.int32)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        for start, end in blocks(num_rows, block_size):
+            np.add.at(sums, labels[start:end], matrix[start:end])
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        centroids = sums / np.where(empty[:, None], 1, norms)
+        # Empty clusters restart from random entities
+        centroids[empty] = matrix[rng.choice(num_rows, int(empty.sum()), replace=False)]
+    return labels, centroids
+
+
+def build_neighbor_graph(embeddings_path, output_path, k=10, num_clusters=None, block_size=BLOCK_SIZE):
+    names, matrix = load_entity_vectors(embeddings_path)
+    neighbors, scores = knn_graph(matrix, k, block_size)
+    num_clusters = num_clusters or max(1, round(math.sqrt(len(names) / 2)))
+    labels, centroids = spherical_kmeans(matrix, num_clusters, block_size=block_size)
+    # Compact format: int32 neighbor ids and half-precision scores instead of JSON lists
+    np.savez_compressed(
+        output_path,
+        names=np.array(names),
+        neighbors=neighbors,
+        scores=scores.astype(np.float16),
+        labels=labels,
+        centroids=centroids.astype(np.float16),
+    )
+    print(f"Neighbor graph built over {len(names)} entities with {neighbors.shape[1]} neighbors each and {len(centroids)} clusters!")
+
+
+def main():
+    embeddings_path = os.getenv('ENTITY_EMBEDDINGS_PATH')
+    if not embeddings_path or not os.path.exists(embeddings_path):
+        raise FileNotFoundError("Entity embeddings path is not defined or does not exist.")
+    output_path = os.getenv('NEIGHBOR_GRAPH_PATH')
+    if not output_path:
+        raise ValueError("Neighbor graph path is not defined.")
+
+    num_clusters = os.getenv('NEIGHBOR_CLUSTERS')
+    build_neighbor_graph(
+        embeddings_path,
+        output_path,
+        k=int(os.getenv('NEIGHBORS_K', 10)),
+        num_clusters=int(num_clusters) if num_clusters else None,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
 import os
 import re
 import json
-import pickle
-import numpy as np
+import uuid
 import streamlit as st
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from sklearn.metrics.pairwise import cosine_similarity
+from lexical_index import lexical_search, load_index, reciprocal_rank_fusion
+from query_embeddings import build_query_embedder
+from common.answer_cache import MISS, answer_cache_from_env, context_fingerprint, kb_version
+from common.lazy import lazy_import
+from common.llm_gateway import BATCH, gateway_from_env
+from common.session_context import entity_vocabulary, is_follow_up, schema_names, session_store_from_env
+
+# Heavy dependencies are loaded on first use, keeping the app's cold start short
+np = lazy_import("numpy")
+triple_table = lazy_import("common.triple_table")
 
 def load_embeddings(file_path):
     with open(file_path, 'r') as file:
@@ -26,24 +33,108 @@ def extract_name(url):
             return re.split(r'[#/]', url)[-1]
     return url
 
-def similarity_search(question, path_similarity):
+@st.cache_resource
+def get_query_embedder():
+    return build_query_embedder()
+
+@st.cache_resource
+def get_llm():
+    # A single gateway per process: all the sessions share its rate limits and in-flight calls
+    return gateway_from_env()
+
+@st.cache_resource
+def load_entity_matrix(path_similarity):
     embeddings_data = load_embeddings(path_similarity)
-    embedding_model = OpenAIEmbeddings(
-        api_key=os.getenv("OPENAI_API_TOKEN"),
-        model="text-embedding-ada-002",
-    )
-    query_vector = embedding_model.embed_query(question)
-    embeddings_list = [np.array(embedding) for embedding in embeddings_data.values()]
-    entity_names = list(embeddings_data.keys())
-    similarities = cosine_similarity([query_vector], embeddings_list)[0]
-    return sorted(zip(entity_names, similarities), key=lambda x: x[1], reverse=True)[:5]
-
-def generate_RAG_answer(question: str, context: str):
-    llm = ChatOpenAI(
-        temperature=0,
-        api_key=os.getenv("OPENAI_API_TOKEN"),
-        model_name="gpt-4o-mini"
-    )
+    matrix = np.array(list(embeddings_data.values()), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return list(embeddings_data.keys()), matrix / np.where(norms > 0, norms, 1)
+
+@st.cache_resource
+def load_triples(path_get_context):
+    return triple_table.TripleTable.from_pickle(path_get_context, shorten=extract_name)
+
+@st.cache_resource
+def get_entity_vocabulary(path_get_context):
+    # Names and labels of the knowledge base entities: a question naming one of them is not a follow-up
+    return entity_vocabulary(load_triples(path_get_context))
+
+@st.cache_resource
+def get_schema_names(path_get_context):
+    # Predicates and classes have embeddings too, but are never worth adding to a context as neighbors
+    return schema_names(load_triples(path_get_context))
+
+@st.cache_resource
+def get_answer_cache():
+    return answer_cache_from_env()
+
+@st.cache_resource
+def get_session_store():
+    return session_store_from_env()
+
+@st.cache_resource
+def load_lexical_index(path_lexical_index):
+    if not path_lexical_index or not os.path.exists(path_lexical_index):
+        return None
+    return load_index(path_lexical_index)
+
+@st.cache_resource
+def load_neighbor_graph(path_neighbor_graph):
+    if not path_neighbor_graph or not os.path.exists(path_neighbor_graph):
+        return None
+    graph = np.load(path_neighbor_graph)
+    names = graph["names"].tolist()
+    return {
+        "names": names,
+        "rows": {name: row for row, name in enumerate(names)},
+        "neighbors": graph["neighbors"],
+        "scores": graph["scores"].astype(np.float32),
+        "labels": graph["labels"],
+    }
+
+def expand_with_neighbors(entities, graph, per_entity, excluded=()):
+    # Each seed reads its row of the precomputed graph: O(k), without any similarity computation.
+    # Only URI entities are expanded to, and not the excluded names (predicates and classes)
+    related, seen = [], set(entities)
+    for entity in entities:
+        row = graph["rows"].get(entity)
+        if row is None:
+            continue
+        added = 0
+        for neighbor, score in zip(graph["neighbors"][row].tolist(), graph["scores"][row].tolist()):
+            if added == per_entity:
+                break
+            name = graph["names"][neighbor]
+            if name in seen or not name.startswith("http") or extract_name(name) in excluded:
+                continue
+            seen.add(name)
+            added += 1
+            related.append((name, entity, score, int(graph["labels"][neighbor]) == int(graph["labels"][row])))
+    return related
+
+def similarity_search(question, path_similarity, path_lexical_index=None, top_k=5):
+    entity_names, entity_matrix = load_entity_matrix(path_similarity)
+    query_vector = get_query_embedder().embed(question)
+    query_norm = np.linalg.norm(query_vector)
+    # Entity rows are unit-normalized once, so cosine similarity is a single matrix-vector product
+    scores = entity_matrix @ (query_vector / query_norm if query_norm > 0 else query_vector)
+    similarities = dict(zip(entity_names, scores.tolist()))
+    dense_ranking = sorted(similarities, key=similarities.get, reverse=True)
+    rankings = [dense_ranking]
+    lexical_index = load_lexical_index(path_lexical_index)
+    if lexical_index is not None:
+        # Exact identifiers typed by the analyst are ranked by BM25 and fused with the dense ranking
+        rankings.append([entity for entity, _ in lexical_search(question, lexical_index)])
+    if len(rankings) == 1:
+        return [(entity, similarities[entity]) for entity in dense_ranking[:top_k]]
+    fused = reciprocal_rank_fusion(rankings)
+    return [(entity, similarities.get(entity, 0.0)) for entity in fused[:top_k]]
+
+def generate_RAG_answer(question: str, context: str, fingerprint: str = None):
+    answer_cache = get_answer_cache()
+    if fingerprint is not None:
+        answer, status, _ = answer_cache.get(question, fingerprint)
+        if answer is not None:
+            return answer, status
     prompt = [
         ("system", """
         You are an AI assistant designed to support a security analyst in monitoring, detecting, and mitigating DDoS and DoS attacks.  
@@ -56,38 +147,66 @@ def generate_RAG_answer(question: str, context: str):
         """),
         ("human", f"Context:\n{context}\n\nQuestion:\n{question}")
     ]
-    return llm.invoke(prompt).content
+    answer = get_llm().invoke(prompt).content
+    if fingerprint is not None:
+        answer_cache.put(question, fingerprint, answer)
+    return answer, MISS
 
 def generate_LLM_answer(question: str):
-    llm = ChatOpenAI(
-        temperature=0,
-        api_key=os.getenv("OPENAI_API_TOKEN"),
-        model_name="gpt-4o-mini"
-    )
-    return llm.invoke(question).content
-
-def get_context(question, path_get_context, path_similarity):
-    results = similarity_search(question, path_similarity)
-    with open(path_get_context, 'rb') as f:
-        train_triples, valid_triples, test_triples = pickle.load(f)
-    all_triples = train_triples + valid_triples + test_triples
-    processed_triples = [
-        (extract_name(triple[0]), extract_name(triple[1]), extract_name(triple[2]))
-        for triple in all_triples
-    ]
-    context = [
-        ([triple for triple in processed_triples if extract_name(entity) in triple], similarity)
-        for entity, similarity in results
+    # Only shown for comparison, so it gives way to the RAG answers
+    return get_llm().invoke(question, priority=BATCH).content
+
+def load_entity_triples(path_get_context, entities):
+    # Rows are looked up in the inverted index of the table, without scanning nor copying the knowledge base
+    table = load_triples(path_get_context)
+    return {entity: table.find(extract_name(entity)) for entity in entities}
+
+def get_context(question, path_get_context, path_similarity, path_lexical_index=None, session=None,
+                path_neighbor_graph=None, neighbor_expansion=0):
+    loader = lambda missing: load_entity_triples(path_get_context, missing)
+    recent = session.recent_entities() if session is not None else []
+    if recent and is_follow_up(question, get_entity_vocabulary(path_get_context)):
+        # Follow-ups about the entities of the previous turns are answered from their stored subgraph,
+        # without embedding the question nor searching again
+        entity_triples, _ = session.fetch(recent, loader)
+        return [], [], [(entity_triples[entity], f"From the conversation: {extract_name(entity)}") for entity in recent]
+    results = similarity_search(question, path_similarity, path_lexical_index)
+    graph = load_neighbor_graph(path_neighbor_graph) if neighbor_expansion > 0 else None
+    # Related attack patterns and similar assets of the retrieved entities join the context
+    related = expand_with_neighbors(
+        [entity for entity, _ in results], graph, neighbor_expansion, get_schema_names(path_get_context)
+    ) if graph else []
+    # Expanded entities are labelled with their seed, so that the model does not take them for search hits
+    labelled = [(entity, f"Similarity: {similarity:.4f}") for entity, similarity in results] + [
+        (entity, f"Related to {extract_name(seed)} (neighbor similarity: {score:.4f})") for entity, seed, score, _ in related
     ]
-    return results, context
+    entities = [entity for entity, _ in labelled]
+    # Triples of the entities already resolved in the conversation are reused instead of fetched again
+    entity_triples, _ = session.fetch(entities, loader) if session is not None else (loader(entities), 0)
+    if session is not None:
+        # The search hits are the entities of the turn, not their neighbors: they are recorded last,
+        # best hit most recent, so that follow-ups refer to them
+        session.remember([entity for entity, _ in reversed(results)])
+    context = [(entity_triples[entity], heading) for entity, heading in labelled]
+    return results, related, context
 
 def format_similarity_results(results):
+    if not results:
+        return ""
     return "Similarity Search Entities:\n" + "\n".join(f"- {entity}: {similarity:.4f}" for entity, similarity in results)
 
+def format_related_entities(related):
+    if not related:
+        return ""
+    return "\nRelated Entities:\n" + "\n".join(
+        f"- {entity}: {score:.4f} (neighbor of {extract_name(seed)}{', same cluster' if same_cluster else ''})"
+        for entity, seed, score, same_cluster in related
+    )
+
 def format_triples(triples):
     return "\nAssociated Triples:\n" + "\n".join(
-        f"\nSimilarity: {similarity:.4f}\n" + "\n".join(f"  - {t[0]} {t[1]} {t[2]}" for t in triple_group)
-        for triple_group, similarity in triples
+        f"\n{heading}\n" + "\n".join(f"  - {t[0]} {t[1]} {t[2]}" for t in triple_group)
+        for triple_group, heading in triples
     )
 
 def rag():
@@ -95,6 +214,8 @@ def rag():
     st.write("I am here to help you!")
     if "messages" not in st.session_state:
         st.session_state["messages"] = []
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex
     for msg in st.session_state["messages"]:
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
@@ -104,18 +225,32 @@ def rag():
             st.markdown(user_input)
         path_get_context = os.getenv('KB_PICKLE_FILE_PATH')
         path_similarity = os.getenv("ENTITY_EMBEDDINGS_PATH")
-        context, triples = get_context(user_input, path_get_context, path_similarity)
-        formatted_context = format_similarity_results(context)
+        path_lexical_index = os.getenv("LEXICAL_INDEX_PATH")
+        path_neighbor_graph = os.getenv("NEIGHBOR_GRAPH_PATH")
+        neighbor_expansion = int(os.getenv("NEIGHBOR_EXPANSION", 0))
+        session = get_session_store().get(st.session_state["session_id"])
+        context, related, triples = get_context(
+            user_input, path_get_context, path_similarity, path_lexical_index, session,
+            path_neighbor_graph, neighbor_expansion,
+        )
+        formatted_context = format_similarity_results(context) + format_related_entities(related)
         formatted_triples = format_triples(triples)
-        rag_answer = generate_RAG_answer(user_input, formatted_triples)
-        llm_answer = generate_LLM_answer(user_input)
+        fingerprint = context_fingerprint(
+            [triple for triple_group, _ in triples for triple in triple_group],
+            kb_version(path_get_context),
+        )
+        rag_answer, cache_status = generate_RAG_answer(user_input, formatted_triples, fingerprint)
         with st.chat_message("assistant"):
             st.markdown(rag_answer)
+            if cache_status != MISS:
+                st.caption("⚡ Answer served from cache")
         st.session_state["messages"].append({"role": "assistant", "content": rag_answer})
-        with st.expander("🔍 Show LLM Answer"):
-            st.markdown(llm_answer)
+        llm_expander = st.expander("🔍 Show LLM Answer")
         with st.expander("📚 Show Context"):
             st.markdown(formatted_context + formatted_triples)
+        # The comparison answer waits in the batch lane, so it is requested once everything else is shown
+        with llm_expander:
+            st.markdown(generate_LLM_answer(user_input))
 
 if __name__ == "__main__":
     rag()
\ No newline at end of file
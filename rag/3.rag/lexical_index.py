@@ -0,0 +1,112 @@
+import os
+import re
+import json
+import math
+import pickle
+from collections import Counter, defaultdict
+
+# Literal predicates whose values describe the subject entity
+DESCRIPTION_PREDICATES = {
+    "http://www.w3.org/2000/01/rdf-schema#label": 3,
+    "http://www.w3.org/2004/02/skos/core#altLabel": 2,
+    "http://d3fend.mitre.org/ontologies/d3fend.owl#synonym": 2,
+    "http://example.org/stix#description": 1,
+    "http://d3fend.mitre.org/ontologies/d3fend.owl#definition": 1,
+    "http://www.w3.org/2000/01/rdf-schema#comment": 1,
+}
+NAME_WEIGHT = 3
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "my", "of", "on", "or", "that", "the", "this", "to", "what", "which", "with",
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def short_name(uri):
+    return re.split(r'[#/]', uri)[-1]
+
+
+def tokenize(text):
+    tokens = []
+    for word in re.findall(r"[A-Za-z0-9]+", text):
+        tokens.append(word.lower())
+        # Identifiers such as "SMTPServer" also match the words they are made of
+        parts = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+", word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return [token for token in tokens if token not in STOPWORDS]
+
+
+def build_documents(triples):
+    documents = defaultdict(Counter)
+    for s, p, o in triples:
+        if not s.startswith("http"):
+            continue
+        if s not in documents:
+            documents[s].update(tokenize(short_name(s)) * NAME_WEIGHT)
+        weight = DESCRIPTION_PREDICATES.get(p)
+        if weight and not o.startswith("http"):
+            documents[s].update(tokenize(o) * weight)
+    return documents
+
+
+def build_index(triples):
+    documents = build_documents(triples)
+    entities = sorted(documents)
+    lengths = [sum(documents[e].values()) for e in entities]
+    avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+    document_frequency = Counter(token for e in entities for token in documents[e])
+    # BM25 term weights do not depend on the query, so they are stored ready to be summed
+    postings = defaultdict(list)
+    for doc_id, entity in enumerate(entities):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / avg_length)
+        for token, tf in documents[entity].items():
+            idf = math.log(1 + (len(entities) - document_frequency[token] + 0.5) / (document_frequency[token] + 0.5))
+            postings[token].append([doc_id, round(idf * tf * (BM25_K1 + 1) / (tf + norm), 6)])
+    return {"entities": entities, "postings": dict(postings)}
+
+
+def load_index(file_path):
+    with open(file_path, 'r') as file:
+        return json.load(file)
+
+
+def lexical_search(question, index, top_k=20):
+    scores = defaultdict(float)
+    for token in set(tokenize(question)):
+        for doc_id, weight in index["postings"].get(token, ()):
+            scores[doc_id] += weight
+    ranking = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+    return [(index["entities"][doc_id], score) for doc_id, score in ranking]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, entity in enumerate(ranking):
+            scores[entity] += 1 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def main():
+    kb_pickle_file = os.getenv('KB_PICKLE_FILE_PATH')
+    if not kb_pickle_file or not os.path.exists(kb_pickle_file):
+        raise FileNotFoundError("Knowledge base pickle file path is not defined or does not exist.")
+    output_path = os.getenv('LEXICAL_INDEX_PATH')
+    if not output_path:
+        raise ValueError("Lexical index path is not defined.")
+
+    with open(kb_pickle_file, 'rb') as f:
+        train_triples, valid_triples, test_triples = pickle.load(f)
+
+    index = build_index(train_triples + valid_triples + test_triples)
+    with open(output_path, 'w') as file:
+        json.dump(index, file)
+    print(f"Lexical index built over {len(index['entities'])} entities and {len(index['postings'])} terms!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from common.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Seconds between two writes of the last use of an entry: hits refresh it on disk at most this often
+TOUCH_INTERVAL = 60
+
+
+def normalize_question(question):
+    return re.sub(r"\s+", " ", question.strip().lower())
+
+
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self, model="text-embedding-ada-002"):
+        from langchain_openai import OpenAIEmbeddings
+        self.model = model
+        # A single client is reused so its HTTP connection pool survives across questions
+        self.client = OpenAIEmbeddings(
+            api_key=os.getenv("OPENAI_API_TOKEN"),
+            model=model,
+        )
+
+    def embed(self, text):
+        return np.asarray(self.client.embed_query(text), dtype=np.float32)
+
+
+class LocalBackend:
+    """Embeds on CPU and maps the result into the ada-002 space with the alignment fitted by the embeddings job."""
+    name = "local"
+
+    def __init__(self, model, alignment_path):
+        try:
+            from fastembed import TextEmbedding
+        except ImportError as e:
+            raise ImportError("The local embedding backend requires the 'fastembed' package.") from e
+        if not alignment_path or not os.path.exists(alignment_path):
+            raise FileNotFoundError("Local alignment matrix path is not defined or does not exist.")
+        self.model = model
+        self.encoder = TextEmbedding(model_name=model)
+        alignment = np.load(alignment_path)
+        self.weight = alignment["weight"].astype(np.float32)
+        self.bias = alignment["bias"].astype(np.float32)
+
+    def embed(self, text):
+        vector = next(iter(self.encoder.embed([text]))).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm > 0 else vector
+        return vector @ self.weight + self.bias
+
+
+class EmbeddingCache:
+    """LRU cache of query vectors, persisted to a SQLite file so it survives restarts.
+
+    Each miss writes only its own row, so the cost of persisting does not grow with the cache. Hits
+    refresh the last use of their row at most every TOUCH_INTERVAL seconds, so that a restart keeps
+    the most recently used entries rather than the most recently stored ones.
+    """
+
+    def __init__(self, capacity=1024, path=None):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.touched = {}
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB, used REAL)")
+            rows = self.db.execute(
+                "SELECT key, vector, used FROM vectors ORDER BY used DESC LIMIT ?", (capacity,)
+            ).fetchall()
+            for key, vector, used in reversed(rows):
+                self.entries[key] = np.frombuffer(vector, dtype=np.float32)
+                self.touched[key] = used
+            self.db.execute("DELETE FROM vectors WHERE key NOT IN (SELECT key FROM vectors ORDER BY used DESC LIMIT ?)", (capacity,))
+
+    def get(self, key):
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is not None:
+                self.entries.move_to_end(key)
+                now = time.time()
+                if self.db is not None and now - self.touched.get(key, 0) >= TOUCH_INTERVAL:
+                    self.db.execute("UPDATE vectors SET used = ? WHERE key = ?", (now, key))
+                    self.touched[key] = now
+            return vector
+
+    def put(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self.lock:
+            self.entries[key] = vector
+            self.entries.move_to_end(key)
+            evicted = []
+            while len(self.entries) > self.capacity:
+                evicted.append(self.entries.popitem(last=False)[0])
+                self.touched.pop(evicted[-1], None)
+            if self.db is not None:
+                self.touched[key] = time.time()
+                self.db.execute(
+                    "INSERT OR REPLACE INTO vectors (key, vector, used) VALUES (?, ?, ?)",
+                    (key, vector.tobytes(), self.touched[key]),
+                )
+                self.db.executemany("DELETE FROM vectors WHERE key = ?", [(k,) for k in evicted])
+
+
+class QueryEmbedder:
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+
+    def embed(self, question):
+        key = f"{self.backend.name}:{self.backend.model}:{normalize_question(question)}"
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.backend.embed(question.strip())
+            self.cache.put(key, vector)
+        return vector
+
+
+def build_query_embedder():
+    backend_name = os.getenv("QUERY_EMBEDDING_BACKEND", "openai")
+    if backend_name == "openai":
+        backend = OpenAIBackend()
+    elif backend_name == "local":
+        backend = LocalBackend(
+            os.getenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5"),
+            os.getenv("LOCAL_ALIGNMENT_PATH"),
+        )
+    else:
+        raise ValueError(f"Unknown query embedding backend '{backend_name}'.")
+    cache = EmbeddingCache(
+        capacity=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 1024)),
+        path=os.getenv("QUERY_EMBEDDING_CACHE_PATH"),
+    )
+    return QueryEmbedder(backend, cache)
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.cache_backend import SQLiteCache
+
+
+def worker(path, keys, seconds, write_ratio, seed, counts):
+    """Reads and writes random keys of the shared cache for the given time, like a service worker would."""
+    cache = SQLiteCache(path)
+    rng = random.Random(seed)
+    value = "x" * 1024
+    operations = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        key = f"answer:{rng.randrange(keys)}"
+        if rng.random() < write_ratio:
+            cache.set(key, value)
+        else:
+            cache.get(key)
+        operations += 1
+    counts.put(operations)
+
+
+def throughput(path, workers, keys, seconds, write_ratio):
+    """Runs the workers as separate processes and returns the operations per second of all of them."""
+    counts = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(path, keys, seconds, write_ratio, seed, counts))
+        for seed in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    total = sum(counts.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return total / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the SQLite cache backend shared by several worker processes.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--write-ratio", type=float, default=0.05, help="Share of the operations that are writes (cache misses).")
+    parser.add_argument("--efficiency", type=float, default=0.7, help="Required share of linear scaling, up to the number of cores.")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    failures = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, "cache.db")
+        cache = SQLiteCache(path)
+        for i in range(args.keys):
+            cache.set(f"answer:{i}", "x" * 1024)
+        cache.close()
+
+        baseline = None
+        for workers in args.workers:
+            ops = throughput(path, workers, args.keys, args.seconds, args.write_ratio)
+            baseline = baseline or ops / min(workers, cores)
+            expected = baseline * min(workers, cores) * args.efficiency
+            print(f"{workers} workers: {ops:,.0f} operations per second ({ops / baseline:.2f}x one worker, {cores} cores)")
+            if ops < expected:
+                failures.append(f"{workers} workers reach {ops:,.0f} operations per second, below {expected:,.0f}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import argparse
+import tarfile
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Streamlit scripts whose cold start is measured, as (directory, script) relative to the repository root
+APPS = {
+    "streamlit_ui": ("3.streamlit_ui", "app.py"),
+    "rag": ("rag/3.rag", "__main__.py"),
+}
+
+# Dependencies that must only be loaded by the code paths that use them
+HEAVY_MODULES = ["langchain_openai", "langchain_neo4j", "sklearn", "numpy", "torch", "fastembed"]
+
+# Runs the first script execution of a session the way `streamlit run` does, without opening a browser
+CHILD = """
+import sys, time, json
+start = time.perf_counter()
+sys.path[:0] = [{app_dir!r}, {root!r}]
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({path!r}, default_timeout=60).run()
+elapsed = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "loaded": loaded, "exception": str(app.exception) if app.exception else None}}))
+"""
+
+
+def run_once(root, app_dir, script):
+    """Starts the app of the given tree in a fresh interpreter and returns its report."""
+    code = CHILD.format(
+        app_dir=os.path.join(root, app_dir),
+        root=root,
+        path=os.path.join(root, app_dir, script),
+        heavy=HEAVY_MODULES,
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=root)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {app_dir}/{script} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def export_tree(ref, output_dir):
+    """Extracts the files of a git revision into a directory."""
+    archive = subprocess.run(["git", "archive", "--format=tar", ref], capture_output=True, cwd=ROOT, check=True)
+    archive_path = os.path.join(output_dir, "tree.tar")
+    with open(archive_path, "wb") as f:
+        f.write(archive.stdout)
+    with tarfile.open(archive_path) as tar:
+        tar.extractall(output_dir)
+    os.remove(archive_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the Streamlit apps against a baseline revision.")
+    parser.add_argument("--baseline-ref", default="HEAD", help="Git revision to compare the working tree with.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown over the baseline.")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as baseline_root:
+        export_tree(args.baseline_ref, baseline_root)
+        for name, (app_dir, script) in APPS.items():
+            if not os.path.exists(os.path.join(baseline_root, app_dir, script)):
+                print(f"{name}: not in {args.baseline_ref}, skipped")
+                continue
+            # Both trees are measured alternately, so that load on the machine affects them alike
+            current, baseline, loaded = [], [], set()
+            for _ in range(args.repeats):
+                report = run_once(ROOT, app_dir, script)
+                if report["exception"]:
+                    raise RuntimeError(f"{name} raised: {report['exception']}")
+                current.append(report["seconds"])
+                loaded.update(report["loaded"])
+                baseline.append(run_once(baseline_root, app_dir, script)["seconds"])
+
+            seconds, baseline_seconds = statistics.median(current), statistics.median(baseline)
+            print(f"{name}: {seconds * 1000:.1f} ms ({args.baseline_ref}: {baseline_seconds * 1000:.1f} ms)")
+            if loaded:
+                failures.append(f"{name} eagerly imports {', '.join(sorted(loaded))}")
+            if seconds > baseline_seconds * (1 + args.tolerance):
+                failures.append(f"{name} cold start regressed by more than {args.tolerance:.0%} over {args.baseline_ref}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
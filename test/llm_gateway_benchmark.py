@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.llm_gateway import BATCH, INTERACTIVE, LLMGateway
+from common.mock_provider import MockProvider
+
+
+async def timed(gateway, question, priority):
+    start = time.perf_counter()
+    try:
+        await gateway.ainvoke([("human", question)], priority=priority)
+        return time.perf_counter() - start, None
+    except Exception as e:
+        return time.perf_counter() - start, e
+
+
+async def cancel_leader(gateway, provider, identical):
+    """Cancels the first of identical in-flight requests and returns the errors of the other ones."""
+    calls = provider.calls
+    tasks = [asyncio.ensure_future(gateway.ainvoke([("human", "Which assets does LAN 1 contain?")])) for _ in range(identical)]
+    await asyncio.sleep(0)
+    tasks[0].cancel()
+    results = await asyncio.gather(*tasks[1:], return_exceptions=True)
+    return [result for result in results if isinstance(result, BaseException)], provider.calls - calls
+
+
+async def run(args):
+    """Sends a burst of batch work, identical interactive questions and distinct ones through the gateway."""
+    provider = MockProvider(latency=args.latency, requests_per_second=args.provider_rps, failure_rate=args.failure_rate, seed=0)
+    gateway = LLMGateway(provider, requests_per_minute=args.gateway_rpm, tokens_per_minute=None,
+                         base_delay=0.2, max_delay=2.0)
+
+    batch = [timed(gateway, f"Batch job {i}", BATCH) for i in range(args.batch)]
+    identical = [timed(gateway, "How can I mitigate a Reflection Amplification attack?", INTERACTIVE) for _ in range(args.identical)]
+    distinct = [timed(gateway, f"Interactive question {i}", INTERACTIVE) for i in range(args.distinct)]
+    results = await asyncio.gather(*batch, *identical, *distinct)
+
+    batch_results = results[:args.batch]
+    interactive_results = results[args.batch:]
+    errors = [error for _, error in results if error is not None]
+    print(f"Requests: {len(results)}, provider calls: {provider.calls}, coalesced: {gateway.stats['coalesced']}, "
+          f"retries: {gateway.stats['retries']}, provider 429s: {provider.rejected}, errors: {len(errors)}")
+    interactive_latency = statistics.median(latency for latency, _ in interactive_results)
+    batch_latency = statistics.median(latency for latency, _ in batch_results)
+    print(f"Median latency: interactive {interactive_latency:.2f} s, batch {batch_latency:.2f} s")
+
+    cancelled_errors, cancelled_calls = await cancel_leader(gateway, provider, args.identical)
+    print(f"Cancelled leader: {len(cancelled_errors)} errors among the {args.identical - 1} other requests, {cancelled_calls} provider calls")
+
+    failures = []
+    if cancelled_errors:
+        failures.append(f"cancelling a request failed the identical ones, e.g. {cancelled_errors[0]!r}")
+    if errors:
+        failures.append(f"{len(errors)} requests failed, e.g. {errors[0]!r}")
+    if provider.calls > args.batch + args.distinct + 1 + gateway.stats["retries"]:
+        failures.append("identical in-flight requests were not coalesced")
+    if interactive_latency >= batch_latency:
+        failures.append("interactive requests were not admitted before batch ones")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the LLM gateway against the mock provider.")
+    parser.add_argument("--batch", type=int, default=40)
+    parser.add_argument("--identical", type=int, default=20)
+    parser.add_argument("--distinct", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="Latency of the mock provider, in seconds.")
+    parser.add_argument("--provider-rps", type=float, default=10, help="Requests per second the mock provider accepts.")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="Share of calls failing with a 503.")
+    parser.add_argument("--gateway-rpm", type=float, default=540, help="Requests per minute admitted by the gateway, below the provider limit.")
+    args = parser.parse_args()
+
+    failures = asyncio.run(run(args))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import pickle
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loads a knowledge base the way a context builder does, then serves requests and reports the peak
+# resident set size reached by loading, and the largest peak of memory allocated during a request.
+# The RSS high-water mark is set by loading, so requests are traced with tracemalloc instead
+CHILD = """
+import sys, re, json, pickle, random, resource, tracemalloc
+sys.path.insert(0, {root!r})
+from common.triple_table import TripleTable
+
+def extract_name(url):
+    return re.split(r'[#/]', url)[-1] if url.startswith("http://") else url
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+if {mode!r} == "table":
+    table = TripleTable.from_pickle({kb!r}, shorten=extract_name)
+    def get_context(names):
+        return [table.find(name, positions=(0, 2)) for name in names]
+    names = [name for name in table.pool if table.find(name, positions=(0, 2))]
+else:
+    # Context builder before the triple table: the splits are concatenated and shortened per request
+    def get_context(names):
+        with open({kb!r}, "rb") as f:
+            train_triples, valid_triples, test_triples = pickle.load(f)
+        processed_triples = [
+            (extract_name(t[0]), extract_name(t[1]), extract_name(t[2]))
+            for t in train_triples + valid_triples + test_triples
+        ]
+        return [[t for t in processed_triples if name in (t[0], t[2])] for name in names]
+    with open({kb!r}, "rb") as f:
+        names = sorted({{extract_name(t[0]) for split in pickle.load(f) for t in split}})
+
+loaded = peak_mb()
+random.seed(0)
+request = 0.0
+tracemalloc.start()
+for _ in range({requests}):
+    sample = random.sample(names, 5)
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    context = get_context(sample)
+    _, peak = tracemalloc.get_traced_memory()
+    request = max(request, (peak - before) / 2 ** 20)
+print(json.dumps({{"loaded": loaded, "request": request}}))
+"""
+
+
+def scale_knowledge_base(kb_path, factor, output_path):
+    """Writes a knowledge base made of `factor` copies of the given one, with the entities of each copy renamed."""
+    with open(kb_path, "rb") as f:
+        splits = pickle.load(f)
+    predicates = {t[1] for split in splits for t in split}
+
+    def rename(name, copy):
+        return name if copy == 0 or name in predicates else f"{name}_{copy}"
+
+    scaled = tuple(
+        [(rename(s, copy), p, rename(o, copy)) for copy in range(factor) for s, p, o in split]
+        for split in splits
+    )
+    with open(output_path, "wb") as f:
+        pickle.dump(scaled, f)
+
+
+def measure(kb_path, mode, requests):
+    """Runs the context builder in a fresh interpreter and returns its peak RSS after loading and its peak allocation per request, in MB."""
+    code = CHILD.format(root=ROOT, kb=kb_path, mode=mode, requests=requests)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    if result.returncode != 0:
+        raise RuntimeError(f"Measuring {mode} on {kb_path} failed:\n{result.stderr}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report["loaded"], report["request"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of the context builders as the knowledge base grows.")
+    parser.add_argument("--kb", default=os.getenv("KB_PICKLE_FILE_PATH"), help="Knowledge base pickle file.")
+    parser.add_argument("--factors", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--tolerance", type=float, default=2.0, help="Allowed growth of the per-request peak allocation, in MB.")
+    parser.add_argument("--legacy", action="store_true", help="Also measure the list-based context builder.")
+    args = parser.parse_args()
+
+    if not args.kb or not os.path.exists(args.kb):
+        parser.error("Knowledge base pickle path is not defined or does not exist.")
+
+    modes = ["table", "legacy"] if args.legacy else ["table"]
+    results = {mode: {} for mode in modes}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for factor in args.factors:
+            kb_path = os.path.join(output_dir, f"kb_x{factor}.pkl")
+            scale_knowledge_base(args.kb, factor, kb_path)
+            for mode in modes:
+                loaded, request = measure(kb_path, mode, args.requests)
+                results[mode][factor] = request
+                print(f"{mode} x{factor}: {loaded:.1f} MB loaded, {request:.2f} MB peak allocation per request")
+
+    growth = results["table"][max(args.factors)] - results["table"][min(args.factors)]
+    if growth > args.tolerance:
+        print(f"FAIL: per-request peak allocation grew by {growth:.2f} MB as the knowledge base grew")
+        sys.exit(1)
+    print(f"Per-request peak allocation grew by {growth:.2f} MB from x{min(args.factors)} to x{max(args.factors)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.session_context import entity_vocabulary, is_follow_up
+
+with open(os.path.join(ROOT, "1.query_translator", "examples.json")) as f:
+    EXAMPLE_QUESTIONS = [example["question"] for example in json.load(f)]
+
+# Fresh questions that use a pronoun or a determiner without referring back to the conversation
+FRESH_QUESTIONS = [
+    "What are the most common DoS attack techniques and how do they work?",
+    "Is this traffic pattern a DDoS attack?",
+    "What does it mean when the firewall drops packets?",
+    "Which malware uses techniques that flood DNS?",
+    "Is it possible to detect a SYN flood at the router?",
+    "What are these alerts about on the mail server?",
+    "So what is a reflection attack?",
+]
+
+FOLLOW_UPS = [
+    "What mitigates it?",
+    "How do I detect them?",
+    "And how do I mitigate it?",
+    "Which malware uses it?",
+    "What else?",
+    "How can I protect against this?",
+    "Tell me more about it.",
+    "What about the other one?",
+]
+
+VOCABULARY = entity_vocabulary([
+    ("Industroyer", "type", "Malware"),
+    ("Industroyer", "label", "Industroyer"),
+    ("Industroyer", "uses", "ApplicationorSystemExploitation"),
+    ("ApplicationorSystemExploitation", "label", "Application or System Exploitation"),
+    ("FilterNetworkTraffic", "mitigates", "ReflectionAmplification"),
+    ("ReflectionAmplification", "label", "Reflection Amplification"),
+])
+
+
+@pytest.mark.parametrize("question", EXAMPLE_QUESTIONS + FRESH_QUESTIONS)
+def test_fresh_questions_are_not_follow_ups(question):
+    assert not is_follow_up(question)
+    assert not is_follow_up(question, VOCABULARY)
+
+
+@pytest.mark.parametrize("question", FOLLOW_UPS)
+def test_follow_ups(question):
+    assert is_follow_up(question, VOCABULARY)
+
+
+def test_questions_naming_an_entity_are_not_follow_ups():
+    assert not is_follow_up("And which malware uses Application or System Exploitation?", VOCABULARY)
+    assert not is_follow_up("What about Industroyer?", VOCABULARY)
+    assert not is_follow_up("How do I mitigate it, the Reflection Amplification?", VOCABULARY)